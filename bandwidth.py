@@ -0,0 +1,305 @@
+import json
+import math
+import time
+
+# Границы частоты рассылки снимков для одного клиента (снимков в секунду)
+MIN_SNAPSHOT_RATE = 5.0
+MAX_SNAPSHOT_RATE = 30.0
+START_SNAPSHOT_RATE = 20.0
+
+# Уровни детализации снимка: 0 - полный, 1 - координаты до десятых, 2 - целые координаты
+MAX_DETAIL_LEVEL = 2
+
+PING_INTERVAL = 1.0  # Как часто измерять RTT (секунды)
+RATE_INCREASE_STEP = 2.0  # Аддитивное повышение частоты (снимков/с за секунду без перегрузки)
+RATE_DECREASE_FACTOR = 0.7  # Мультипликативное снижение при перегрузке
+RTT_CONGESTION_MARGIN = 0.05  # Рост RTT над минимальным, после которого считаем канал перегруженным
+THROUGHPUT_FORGET_TIME = 5.0  # Через столько секунд без очереди оценка пропускной способности сбрасывается
+DETAIL_RECOVERY_TIME = 2.0  # Сколько секунд без перегрузки нужно для повышения детализации
+EWMA_ALPHA = 0.2
+
+# Бюджет одного снимка в байтах. Пока канал не упирается в пропускную способность,
+# клиент получает полные снимки; бюджет снижается, только когда канал их не тянет
+MAX_SNAPSHOT_BYTES = 65536
+MIN_SNAPSHOT_BYTES = 500
+
+# Приоритеты сущностей в упаковке снимка (единиц в секунду)
+TANK_PRIORITY = 4.0
+BULLET_PRIORITY = 1.0
+INCOMING_BULLET_PRIORITY = 12.0  # Пуля летит в сторону танка клиента
+PRIORITY_DISTANCE = 300.0  # На этом расстоянии приоритет падает вдвое
+INCOMING_COS = math.cos(math.radians(20))
+
+
+class ClientLink:
+    """Оценка пропускной способности и RTT канала одного клиента"""
+
+    def __init__(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.rate = START_SNAPSHOT_RATE
+        self.detail = 0
+        self.rtt = None
+        self.min_rtt = None
+        self.throughput = None  # Байт в секунду, оценка по реально ушедшим в сокет байтам
+        self.avg_snapshot_size = None
+        self.last_flush_time = now
+        self.saturated = False  # После прошлой отправки в очереди остались байты
+        self.last_saturated_time = now
+        self.next_send_time = now
+        self.last_adjust_time = now
+        self.last_ping_time = now
+        self.last_congestion_time = now
+        self.congested = False
+        self.packer = SnapshotPacker(now)
+
+    def is_due(self, now):
+        return now >= self.next_send_time
+
+    def should_ping(self, now):
+        if now - self.last_ping_time >= PING_INTERVAL:
+            self.last_ping_time = now
+            return True
+        return False
+
+    def on_pong(self, sent_time, now):
+        sample = now - sent_time
+        if sample < 0:
+            return
+        self.rtt = sample if self.rtt is None else self.rtt + EWMA_ALPHA * (sample - self.rtt)
+        self.min_rtt = sample if self.min_rtt is None else min(self.min_rtt, sample)
+        if self.rtt > self.min_rtt + RTT_CONGESTION_MARGIN:
+            self.congested = True
+
+    def on_flush(self, drained, backlog, now):
+        """Учет байт, принятых сокетом с прошлой отправки, и оставшейся очереди"""
+        elapsed = now - self.last_flush_time
+        self.last_flush_time = now
+        if elapsed > 0:
+            sample = drained / elapsed
+            if self.saturated:
+                # Очередь не пустела весь интервал - канал пропустил ровно столько
+                self.throughput = sample if self.throughput is None else self.throughput + EWMA_ALPHA * (sample - self.throughput)
+            elif self.throughput is not None:
+                if sample > self.throughput:
+                    # Без очереди видно только то, что отправили; это нижняя граница
+                    self.throughput = sample
+                elif now - self.last_saturated_time >= THROUGHPUT_FORGET_TIME:
+                    # Канал давно не перегружен - снова пробуем полные снимки
+                    self.throughput = None
+        self.saturated = backlog > 0
+        if self.saturated:
+            self.last_saturated_time = now
+            self.congested = True
+
+    def on_queued(self, size, now):
+        """Учет поставленного в очередь снимка и планирование следующей отправки"""
+        if self.avg_snapshot_size is None:
+            self.avg_snapshot_size = size
+        else:
+            self.avg_snapshot_size += EWMA_ALPHA * (size - self.avg_snapshot_size)
+
+        self._adjust(now)
+        # Планируем от предыдущего дедлайна, чтобы частота не уплывала,
+        # но не копим отставание, если клиент пропустил несколько слотов
+        self.next_send_time = max(self.next_send_time + 1.0 / self.rate, now)
+
+    def byte_budget(self):
+        """Сколько байт можно потратить на один снимок этому клиенту"""
+        if not self.throughput:
+            return MAX_SNAPSHOT_BYTES
+        return int(max(MIN_SNAPSHOT_BYTES, min(MAX_SNAPSHOT_BYTES, self.throughput / self.rate)))
+
+    def _adjust(self, now):
+        elapsed = now - self.last_adjust_time
+        self.last_adjust_time = now
+
+        if self.congested:
+            self.congested = False
+            self.last_congestion_time = now
+            if self.rate > MIN_SNAPSHOT_RATE:
+                self.rate = max(MIN_SNAPSHOT_RATE, self.rate * RATE_DECREASE_FACTOR)
+            else:
+                # Частота уже минимальная - уменьшаем объем снимка
+                self.detail = min(MAX_DETAIL_LEVEL, self.detail + 1)
+            return
+
+        # Не требуем от канала больше, чем он способен передать
+        if self.throughput and self.avg_snapshot_size:
+            affordable_rate = self.throughput / self.avg_snapshot_size
+            if affordable_rate < self.rate:
+                self.rate = max(MIN_SNAPSHOT_RATE, affordable_rate)
+                return
+
+        # Канал справляется - сначала возвращаем детализацию, затем частоту
+        if self.detail > 0:
+            if now - self.last_congestion_time >= DETAIL_RECOVERY_TIME:
+                self.detail -= 1
+                self.last_congestion_time = now
+        else:
+            self.rate = min(MAX_SNAPSHOT_RATE, self.rate + RATE_INCREASE_STEP * elapsed)
+
+
+def reduce_detail(state, detail):
+    """Копия состояния с округленными числами для уровня детализации detail"""
+    if detail <= 0:
+        return state
+
+    digits = 1 if detail == 1 else 0
+
+    def round_value(key, value):
+        if not isinstance(value, float):
+            return value
+        if key == 'angle':
+            # Угол нужен с большей точностью, иначе пушка и пули уходят в сторону
+            return round(value, 3)
+        value = round(value, digits)
+        return int(value) if digits == 0 else value
+
+    tanks = {
+        tid: {key: round_value(key, value) for key, value in tank.items()}
+        for tid, tank in state['tanks'].items()
+    }
+    bullets = [
+        {key: round_value(key, value) for key, value in bullet.items()}
+        for bullet in state['bullets']
+    ]
+
+    reduced = dict(state)
+    reduced['tanks'] = tanks
+    reduced['bullets'] = bullets
+    return reduced
+
+
+class SnapshotPacker:
+    """Упаковка снимка в бюджет байт по накопленным приоритетам сущностей.
+
+    Каждый снимок приоритет сущности прибавляется к ее счетчику с учетом
+    прошедшего времени; в снимок жадно попадают сущности с наибольшими
+    счетчиками, пока хватает бюджета, а счетчики отправленных обнуляются.
+    Так близкие танки и летящие в клиента пули обновляются чаще всего,
+    а остальные все равно со временем доходят до клиента.
+
+    Исчезнувшие сущности передаются дельтой: в снимок попадают только id,
+    пропавшие с тех пор, как о них узнал клиент, и они тоже расходуют бюджет.
+    """
+
+    def __init__(self, now=None):
+        self.accumulators = {}
+        self.last_time = time.monotonic() if now is None else now
+        self.known = set()  # Сущности, которые могут быть у клиента: ('t', id) и ('b', id)
+        # Что вернуть упаковщику, если последний снимок не дойдет до сокета:
+        # счетчики отправленных сущностей и переданные удаления
+        self.last_packed = ({}, set())
+
+    def restore(self, packed):
+        """Снимок не дошел до сокета - его сущности и удаления снова ждут отправки"""
+        values, removed = packed
+        for key, value in values.items():
+            if key in self.accumulators:
+                self.accumulators[key] = max(self.accumulators[key], value)
+        self.known |= removed
+
+    def mark_all_sent(self, state, now):
+        """Клиенту ушел полный снимок - он заменяет все, что было у клиента"""
+        self.accumulators.clear()
+        self.last_time = now
+        self.last_packed = ({}, self.known)
+        self.known = self.entity_keys(state)
+
+    @staticmethod
+    def entity_keys(state):
+        keys = {('t', tid) for tid in state['tanks']}
+        keys.update(('b', bullet['id']) for bullet in state['bullets'])
+        return keys
+
+    def pack(self, state, tank_id, budget, now):
+        elapsed = max(0.0, now - self.last_time)
+        self.last_time = now
+
+        tanks = state['tanks']
+        own_key = str(tank_id)
+        own = tanks.get(own_key)
+
+        packed = {
+            'tanks': {},
+            'bullets': [],
+            'game_time': state['game_time'],
+            'game_started': state['game_started'],
+            'game_ended': state['game_ended'],
+            'partial': True,
+            'removed_tanks': [],
+            'removed_bullets': [],
+        }
+        used = len(json.dumps(packed))
+        # Свой танк клиент видит всегда
+        if own is not None:
+            packed['tanks'][own_key] = own
+            used += len(json.dumps(own)) + len(own_key) + 6
+
+        # Удаления важнее обновлений: не влезшие остаются в known до следующего снимка
+        removed = set()
+        for key in self.known - self.entity_keys(state):
+            entity_id = int(key[1]) if key[0] == 't' else key[1]
+            size = len(json.dumps(entity_id)) + 2
+            if used + size > budget:
+                continue
+            used += size
+            removed.add(key)
+            packed['removed_tanks' if key[0] == 't' else 'removed_bullets'].append(entity_id)
+        self.known -= removed
+
+        candidates = []
+        accumulators = {}
+        for tid, tank in tanks.items():
+            if tid == own_key:
+                continue
+            key = ('t', tid)
+            value = self.accumulators.get(key, 0.0) + elapsed * self.tank_priority(tank, own)
+            accumulators[key] = value
+            candidates.append((value, key, tank))
+        for bullet in state['bullets']:
+            key = ('b', bullet['id'])
+            value = self.accumulators.get(key, 0.0) + elapsed * self.bullet_priority(bullet, own)
+            accumulators[key] = value
+            candidates.append((value, key, bullet))
+        # Счетчики исчезнувших сущностей выбрасываются вместе со старым словарем
+        self.accumulators = accumulators
+        values = {}
+        self.last_packed = (values, removed)
+
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        for value, key, entity in candidates:
+            size = len(json.dumps(entity)) + 2
+            if key[0] == 't':
+                size += len(key[1]) + 4
+            if used + size > budget:
+                continue  # Не влезает - пробуем сущности поменьше
+            used += size
+            values[key] = value
+            accumulators[key] = 0.0
+            self.known.add(key)
+            if key[0] == 't':
+                packed['tanks'][key[1]] = entity
+            else:
+                packed['bullets'].append(entity)
+        return packed
+
+    @staticmethod
+    def tank_priority(tank, own):
+        if own is None:
+            return TANK_PRIORITY
+        distance = math.hypot(tank['x'] - own['x'], tank['y'] - own['y'])
+        return TANK_PRIORITY / (1.0 + distance / PRIORITY_DISTANCE)
+
+    @staticmethod
+    def bullet_priority(bullet, own):
+        if own is None:
+            return BULLET_PRIORITY
+        to_x, to_y = own['x'] - bullet['x'], own['y'] - bullet['y']
+        distance = math.hypot(to_x, to_y)
+        priority = BULLET_PRIORITY
+        if distance > 0:
+            heading = (math.cos(bullet['angle']) * to_x + math.sin(bullet['angle']) * to_y) / distance
+            if heading >= INCOMING_COS:
+                priority = INCOMING_BULLET_PRIORITY
+        return priority / (1.0 + distance / PRIORITY_DISTANCE)
@@ -0,0 +1,216 @@
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from game import Game
+from scheduler import TickScheduler, TICK_RATE
+from transport import configure_socket, send_frames
+
+CLIENTS = 8
+DURATION = 5.0
+INPUT_RATE = 60  # Кадров клиента в секунду
+SHOOT_EVERY = 6  # Каждый какой кадр клиент еще и стреляет
+PING_EVERY = TICK_RATE  # Раз в сколько тиков сервер отправляет ping
+
+MODES = {
+    # Как было: Нейгл включен, каждое сообщение клиента - свой sendall
+    'legacy': False,
+    # transport.py: TCP_NODELAY, все кадры за тик/кадр - один sendmsg
+    'transport': True,
+}
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def get(self, name):
+        return self.values.get(name, 0)
+
+
+def send(sock, frames, batched, counters, name):
+    if batched:
+        send_frames(sock, frames)
+        counters.add(name)
+    else:
+        for frame in frames:
+            sock.sendall(frame)
+            counters.add(name)
+
+
+def read_frames(sock, counters, name, handle, stop):
+    buffer = b''
+    while not stop.is_set():
+        try:
+            data = sock.recv(65536)
+        except OSError:
+            return
+        counters.add(name)
+        if not data:
+            return
+        buffer += data
+        *frames, buffer = buffer.split(b'\n')
+        for frame in frames:
+            handle(frame)
+
+
+def run_server(listener, clients, batched, counters, stop):
+    """Упрощенный сервер: ввод применяется сразу, снимок рассылается каждый тик"""
+    game = Game(create_screen=False)
+    game_lock = threading.Lock()
+    conns = []
+
+    for tank_id in range(clients):
+        conn, _ = listener.accept()
+        if batched:
+            configure_socket(conn)
+        with game_lock:
+            game.apply_command(tank_id, {'type': 'join'})
+        conn.sendall(b'{"type": "init", "tank_id": %d}\n' % tank_id)
+        conns.append(conn)
+
+        def handle(frame, tank_id=tank_id):
+            message = json.loads(frame)
+            if message['type'] in ('move', 'shoot'):
+                with game_lock:
+                    game.apply_command(tank_id, message)
+
+        threading.Thread(target=read_frames, args=(conn, counters, 'server_recv', handle, stop), daemon=True).start()
+
+    scheduler = TickScheduler(TICK_RATE, stop_event=stop, name="Бенчмарк")
+
+    def step(dt):
+        with game_lock:
+            game.update(dt)
+
+    def broadcast():
+        with game_lock:
+            raw = json.dumps(game.get_state()).encode('utf-8')
+        state = b'{"type": "state", "data": ' + raw + b'}\n'
+        frames = [state]
+        if scheduler.ticks % PING_EVERY == 0:
+            frames.insert(0, (json.dumps({'type': 'ping', 't': time.monotonic()}) + '\n').encode('utf-8'))
+        if not batched:
+            # Старый сервер склеивал ping и снимок в одну строку перед sendall
+            frames = [b''.join(frames)]
+        for conn in conns:
+            try:
+                send(conn, frames, batched, counters, 'server_send')
+            except OSError:
+                pass
+
+    scheduler.run(step, broadcast)
+    for conn in conns:
+        conn.close()
+
+
+def run_client(address, batched, counters, latencies, stop):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if batched:
+        configure_socket(sock)
+    sock.connect(address)
+    init = b''
+    while not init.endswith(b'\n'):
+        init += sock.recv(1)
+    tank_id = json.loads(init)['tank_id']
+
+    # Ввод помечается уникальным углом пушки; задержка - время до снимка с этим углом
+    sent = {}
+    sent_lock = threading.Lock()
+    send_lock = threading.Lock()
+
+    def handle(frame):
+        message = json.loads(frame)
+        if message['type'] == 'ping':
+            with send_lock:
+                send(sock, [(json.dumps({'type': 'pong', 't': message['t']}) + '\n').encode('utf-8')],
+                     batched, counters, 'client_send')
+        elif message['type'] == 'state':
+            tank = message['data']['tanks'].get(str(tank_id))
+            if tank is None:
+                return
+            now = time.perf_counter()
+            with sent_lock:
+                sent_at = sent.pop(tank['angle'], None)
+                if sent_at is not None:
+                    latencies.append(now - sent_at)
+                    # Более старые метки уже перекрыты этим вводом
+                    for angle in [angle for angle, t in sent.items() if t < sent_at]:
+                        del sent[angle]
+
+    reader = threading.Thread(target=read_frames, args=(sock, counters, 'client_recv', handle, stop), daemon=True)
+    reader.start()
+
+    frame = 0
+    next_frame = time.perf_counter()
+    while not stop.is_set():
+        frames = []
+        if frame % SHOOT_EVERY == 0:
+            frames.append(b'{"type": "shoot"}\n')
+        angle = (frame % 6000) * 0.001
+        frames.append((json.dumps({'type': 'move', 'dx': 0, 'dy': 0, 'angle': angle}) + '\n').encode('utf-8'))
+        with sent_lock:
+            sent[angle] = time.perf_counter()
+        try:
+            with send_lock:
+                send(sock, frames, batched, counters, 'client_send')
+        except OSError:
+            break
+        frame += 1
+        next_frame += 1.0 / INPUT_RATE
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+    sock.close()
+
+
+def run_mode(batched, clients=CLIENTS, duration=DURATION):
+    counters = Counters()
+    latencies = []
+    stop = threading.Event()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(clients)
+    address = listener.getsockname()
+
+    server = threading.Thread(target=run_server, args=(listener, clients, batched, counters, stop), daemon=True)
+    server.start()
+    threads = [threading.Thread(target=run_client, args=(address, batched, counters, latencies, stop), daemon=True)
+               for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(duration)
+    stop.set()
+    for thread in threads + [server]:
+        thread.join(timeout=2)
+    listener.close()
+
+    latencies = sorted(latencies)
+    return {
+        'samples': len(latencies),
+        'median': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        'send': (counters.get('server_send') + counters.get('client_send')) / duration,
+        'recv': (counters.get('server_recv') + counters.get('client_recv')) / duration,
+    }
+
+
+if __name__ == '__main__':
+    # python bench_transport.py [клиентов] [секунд на режим]
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else CLIENTS
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else DURATION
+    print(f"Loopback: {clients} клиентов, ввод {INPUT_RATE} Гц, тики {TICK_RATE} Гц, {duration} с на режим")
+    print(f"{'режим':<10} {'замеров':>8} {'медиана, мс':>12} {'p99, мс':>9} {'send/с':>8} {'recv/с':>8}")
+    for name, batched in MODES.items():
+        result = run_mode(batched, clients, duration)
+        print(f"{name:<10} {result['samples']:>8} {result['median']:>12.2f} {result['p99']:>9.2f} "
+              f"{result['send']:>8.0f} {result['recv']:>8.0f}")
@@ -0,0 +1,269 @@
+import math
+import random
+from collections import deque
+
+from game import SCREEN_WIDTH, SCREEN_HEIGHT, TANK_SIZE, TANK_SPEED, BOT_ID_BASE
+
+CELL_SIZE = 20
+BOT_SPEED = TANK_SPEED * 60  # Пикселей в секунду, как у игрока с клиентом на 60 FPS
+BOT_FIRE_INTERVAL = 0.8
+BOT_AIM_SPREAD = 0.08  # Разброс прицела в радианах
+BOT_ENGAGE_DISTANCE = 220  # Ближе этого при прямой видимости бот перестает сближаться
+FLOW_FIELD_BUDGET = 400  # Сколько клеток поле потока пересчитывает за тик
+
+_NEIGHBORS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+_UNREACHABLE = -1
+
+
+class NavGrid:
+    """Сетка проходимости уровня, общая для всех ботов"""
+
+    def __init__(self, walls, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cols = width // cell_size
+        self.rows = height // cell_size
+        # solid - клетка пересекает стену (для проверки прямой видимости),
+        # blocked - в клетке не помещается центр танка
+        self.solid = bytearray(self.cols * self.rows)
+        self.blocked = bytearray(self.cols * self.rows)
+        half = TANK_SIZE // 2
+        for row in range(self.rows):
+            for col in range(self.cols):
+                x, y = col * cell_size, row * cell_size
+                cx, cy = x + cell_size / 2, y + cell_size / 2
+                index = row * self.cols + col
+                for wall in walls:
+                    rect = wall.rect
+                    if rect.left < x + cell_size and x < rect.right and rect.top < y + cell_size and y < rect.bottom:
+                        self.solid[index] = 1
+                    if rect.left < cx + half and cx - half < rect.right and rect.top < cy + half and cy - half < rect.bottom:
+                        self.blocked[index] = 1
+
+    def cell_at(self, x, y):
+        col = min(self.cols - 1, max(0, int(x // self.cell_size)))
+        row = min(self.rows - 1, max(0, int(y // self.cell_size)))
+        return row * self.cols + col
+
+    def center(self, index):
+        row, col = divmod(index, self.cols)
+        return (col + 0.5) * self.cell_size, (row + 0.5) * self.cell_size
+
+    def nearest_open(self, index):
+        """Ближайшая проходимая клетка (цель может стоять вплотную к стене)"""
+        if not self.blocked[index]:
+            return index
+        seen = {index}
+        queue = deque([index])
+        while queue:
+            current = queue.popleft()
+            for neighbor in self.neighbors(current, blocked_ok=True):
+                if neighbor in seen:
+                    continue
+                if not self.blocked[neighbor]:
+                    return neighbor
+                seen.add(neighbor)
+                queue.append(neighbor)
+        return index
+
+    def neighbors(self, index, blocked_ok=False):
+        row, col = divmod(index, self.cols)
+        for dc, dr in _NEIGHBORS:
+            c, r = col + dc, row + dr
+            if 0 <= c < self.cols and 0 <= r < self.rows:
+                neighbor = r * self.cols + c
+                if blocked_ok or not self.blocked[neighbor]:
+                    yield neighbor
+
+    def line_of_sight(self, x0, y0, x1, y1):
+        steps = int(math.hypot(x1 - x0, y1 - y0) / (self.cell_size / 2)) + 1
+        for i in range(steps + 1):
+            t = i / steps
+            if self.solid[self.cell_at(x0 + (x1 - x0) * t, y0 + (y1 - y0) * t)]:
+                return False
+        return True
+
+
+class FlowField:
+    """Карта расстояний до цели по сетке (BFS).
+
+    Когда цель переходит в другую клетку, новая карта строится по частям,
+    не больше FLOW_FIELD_BUDGET клеток за тик; пока она не готова, боты
+    пользуются предыдущей.
+    """
+
+    def __init__(self, grid, target_cell):
+        self.grid = grid
+        self.target_cell = None
+        self.distances = None
+        self.pending = None
+        self.frontier = None
+        self.retarget(target_cell)
+        # Первая карта нужна сразу
+        while self.frontier:
+            self.advance(len(grid.blocked))
+
+    def retarget(self, target_cell):
+        target_cell = self.grid.nearest_open(target_cell)
+        if target_cell == self.target_cell:
+            return
+        self.target_cell = target_cell
+        self.pending = [_UNREACHABLE] * len(self.grid.blocked)
+        self.pending[target_cell] = 0
+        self.frontier = deque([target_cell])
+
+    def advance(self, budget=FLOW_FIELD_BUDGET):
+        if not self.frontier:
+            return
+        pending = self.pending
+        frontier = self.frontier
+        while frontier and budget > 0:
+            current = frontier.popleft()
+            budget -= 1
+            distance = pending[current] + 1
+            for neighbor in self.grid.neighbors(current):
+                if pending[neighbor] == _UNREACHABLE:
+                    pending[neighbor] = distance
+                    frontier.append(neighbor)
+        if not frontier:
+            self.distances = pending
+            self.pending = None
+            self.frontier = None
+
+    def next_cell(self, cell):
+        """Соседняя клетка, которая ближе к цели, или None"""
+        distances = self.distances
+        best, best_distance = None, distances[cell]
+        if best_distance == _UNREACHABLE:
+            best_distance = math.inf
+        for neighbor in self.grid.neighbors(cell):
+            distance = distances[neighbor]
+            if distance != _UNREACHABLE and distance < best_distance:
+                best, best_distance = neighbor, distance
+        return best
+
+
+class BotManager:
+    """Боты на стороне сервера: занимают свободные места и играют как игроки"""
+
+    def __init__(self, game, seats):
+        self.game = game
+        self.seats = seats  # Сколько мест в матче должно быть занято
+        self.grid = NavGrid(game.walls, game.map.width, game.map.height)
+        self.fields = {}  # id цели -> FlowField, общий для всех ботов с этой целью
+        self.fire_cooldowns = {}
+        self.next_bot_id = BOT_ID_BASE
+
+    def sync(self):
+        """Добавляет ботов на пустые места и убирает лишних при подключении игроков"""
+        tanks = self.game.tanks
+        bots = [tid for tid, tank in tanks.items() if tank.bot]
+        humans = len(tanks) - len(bots)
+
+        while len(tanks) < self.seats:
+            bot_id = self.next_bot_id
+            self.next_bot_id += 1
+            bot = self.game.add_tank(bot_id)
+            bot.bot = True
+            bot.player_key = f"bot-{bot_id - BOT_ID_BASE + 1}"
+            self.fire_cooldowns[bot_id] = BOT_FIRE_INTERVAL
+            bots.append(bot_id)
+
+        while bots and len(tanks) > self.seats:
+            bot_id = bots.pop()
+            del tanks[bot_id]
+            self.fire_cooldowns.pop(bot_id, None)
+
+        # Матч начинается, как только есть живой игрок и соперник
+        if humans > 0 and len(tanks) >= 2 and not self.game.game_started:
+            self.game.start_game()
+            print("Игра началась! Таймер: 60 секунд")
+
+    def field_for(self, target):
+        cell = self.grid.cell_at(target.x, target.y)
+        field = self.fields.get(target.id)
+        if field is None:
+            field = FlowField(self.grid, cell)
+            self.fields[target.id] = field
+        return field
+
+    def update(self, dt):
+        self.sync()
+        tanks = self.game.tanks
+
+        # Каждое поле пересчитывается один раз за тик, сколько бы ботов за ним ни шло.
+        # Новая цель берется только после того, как достроена карта для предыдущей,
+        # иначе быстро движущаяся цель не давала бы карте достроиться
+        for target_id, field in self.fields.items():
+            target = tanks.get(target_id)
+            if target is not None and field.frontier is None:
+                field.retarget(self.grid.cell_at(target.x, target.y))
+            field.advance()
+
+        if self.game.game_ended:
+            return
+
+        used = set()
+        for tank in list(tanks.values()):
+            if tank.bot and tank.alive:
+                target_id = self.control(tank, dt)
+                if target_id is not None:
+                    used.add(target_id)
+
+        for target_id in list(self.fields):
+            if target_id not in used:
+                del self.fields[target_id]
+
+    def control(self, tank, dt):
+        """Ход бота за тик; возвращает id цели, к которой он шел"""
+        target = self.pick_target(tank)
+        if target is None:
+            return None
+
+        distance = math.hypot(target.x - tank.x, target.y - tank.y)
+        visible = self.grid.line_of_sight(tank.x, tank.y, target.x, target.y)
+
+        angle = tank.angle
+        dx = dy = 0.0
+        if not (visible and distance < BOT_ENGAGE_DISTANCE):
+            field = self.field_for(target)
+            next_cell = field.next_cell(self.grid.cell_at(tank.x, tank.y))
+            if next_cell is not None:
+                nx, ny = self.grid.center(next_cell)
+                step = min(BOT_SPEED * dt, math.hypot(nx - tank.x, ny - tank.y))
+                move_angle = math.atan2(ny - tank.y, nx - tank.x)
+                dx, dy = math.cos(move_angle) * step, math.sin(move_angle) * step
+                angle = move_angle
+
+        if visible:
+            angle = math.atan2(target.y - tank.y, target.x - tank.x)
+
+        old_x, old_y = tank.x, tank.y
+        arena = self.game.map
+        tank.update(dx, dy, angle, self.game.walls, 0, arena)
+        if (dx or dy) and tank.x == old_x and tank.y == old_y:
+            # Уперлись в угол стены - скользим вдоль нее по одной из осей
+            tank.update(dx, 0, angle, self.game.walls, 0, arena)
+            if tank.x == old_x:
+                tank.update(0, dy, angle, self.game.walls, 0, arena)
+
+        cooldown = self.fire_cooldowns.get(tank.id, 0) - dt
+        if visible and cooldown <= 0 and not target.is_invulnerable():
+            tank.angle = angle + random.uniform(-BOT_AIM_SPREAD, BOT_AIM_SPREAD)
+            bullet = tank.shoot()
+            tank.angle = angle
+            if bullet:
+                self.game.add_bullet(bullet)
+            cooldown = BOT_FIRE_INTERVAL
+        self.fire_cooldowns[tank.id] = cooldown
+        return target.id
+
+    def pick_target(self, tank):
+        # Ближайший живой соперник; игроки приоритетнее других ботов
+        best, best_key = None, None
+        for other in self.game.tanks.values():
+            if other.id == tank.id or not other.alive:
+                continue
+            key = (other.bot, (other.x - tank.x) ** 2 + (other.y - tank.y) ** 2)
+            if best_key is None or key < best_key:
+                best, best_key = other, key
+        return best
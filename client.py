@@ -4,50 +4,94 @@ import json
 import threading
 import math
 from game import Game, TANK_SPEED
+from maps import load_map, map_path, DEFAULT_MAP
+from transport import configure_socket, send_frames, parse_buffer_args
 
 HOST = 'localhost'
 PORT = 5555
+SPECTATOR_PORT = 5556
+# Сервер всегда кодирует тип сообщения первым полем, поэтому снимок
+# распознается по префиксу строки без разбора JSON
+STATE_PREFIX = b'{"type": "state"'
+# Частичный снимок (см. bandwidth.SnapshotPacker) помечен вторым полем
+PARTIAL_PREFIX = b'{"type": "state", "partial": true'
 
 class GameClient:
-    def __init__(self, server_host=HOST):
+    def __init__(self, server_host=HOST, port=PORT, spectator=False, send_buffer=None, recv_buffer=None,
+                 region=None, rating=None, name=None):
         self.server_host = server_host
+        self.port = port
+        self.spectator = spectator  # Зритель только смотрит матч, без своего танка
         pygame.init()
         self.screen = pygame.display.set_mode((800, 600))
-        pygame.display.set_caption("Tanks Battle - Client")
+        pygame.display.set_caption("Tanks Battle - Spectator" if spectator else "Tanks Battle - Client")
         self.clock = pygame.time.Clock()
         self.font = pygame.font.Font(None, 36)
         
         self.game = Game()
         # Переопределяем экран игры на наш экран клиента
         self.game.screen = self.screen
+        self.camera = (0, 0)  # Смещение видимой области на арене, больше окна
+        self.view_center = None  # Точка обзора зрителя
         
         self.tank_id = None
         self.socket = None
         self.running = True
-        self.last_state = None
+        self.recv_buffer = b''
+        # Полученные снимки в виде байтов; декодируются только при отрисовке.
+        # Хранится последний полный снимок и все частичные после него: частичный
+        # снимок несет только часть сущностей, и пропускать его нельзя
+        self.pending_states = []
+        self.state_lock = threading.Lock()
+        # Сообщения кадра копятся и уходят одним вызовом в конце кадра
+        self.outbox = []
+        self.send_lock = threading.Lock()
+        self.send_buffer_size = send_buffer
+        self.recv_buffer_size = recv_buffer
+        # Для подбора соперников в лобби; не заданные поля сервер заменит своими
+        self.region = region
+        self.rating = rating
+        self.name = name  # Под этим именем игрок попадает в статистику
     
     def connect(self):
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.server_host, PORT))
-            print(f"Подключено к серверу {self.server_host}:{PORT}")
+            configure_socket(self.socket, self.send_buffer_size, self.recv_buffer_size)
+            self.socket.connect((self.server_host, self.port))
+            print(f"Подключено к серверу {self.server_host}:{self.port}")
+            if not self.spectator:
+                hello = {'type': 'hello'}
+                if self.region is not None:
+                    hello['region'] = self.region
+                if self.rating is not None:
+                    hello['rating'] = self.rating
+                if self.name is not None:
+                    hello['name'] = self.name
+                self.send_message(hello)
             
             # Получение начального состояния (может прийти частями)
-            buffer = ''
             while True:
-                data = self.socket.recv(4096).decode('utf-8')
+                data = self.socket.recv(4096)
                 if not data:
                     break
                 
-                buffer += data
-                if '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
+                self.recv_buffer += data
+                while b'\n' in self.recv_buffer:
+                    # Остаток буфера после init разберет receive_loop
+                    line, self.recv_buffer = self.recv_buffer.split(b'\n', 1)
                     if line.strip():
                         try:
                             message = json.loads(line)
-                            if message['type'] == 'init':
+                            if message['type'] == 'queued':
+                                print("Ожидание соперника в лобби...")
+                            elif message['type'] == 'init':
                                 self.tank_id = message['tank_id']
+                                if not self.load_map(message.get('map_id', DEFAULT_MAP), message.get('map_hash')):
+                                    return False
                                 self.game.set_state(message['state'])
+                                if self.spectator:
+                                    print("Режим зрителя")
+                                    return True
                                 print(f"Ваш танк ID: {self.tank_id}")
                                 print(f"Танков в игре: {len(self.game.tanks)}")
                                 if self.tank_id in self.game.tanks:
@@ -65,45 +109,136 @@ class GameClient:
             traceback.print_exc()
             return False
     
+    def load_map(self, map_id, map_hash):
+        # Сервер передает только id карты - сама карта загружается из локального файла
+        try:
+            game_map = load_map(map_id)
+        except ValueError as e:
+            print(f"Сервер прислал неверную карту. {e}")
+            return False
+        except FileNotFoundError:
+            print(f"Карта {map_id} сервера не найдена: нет файла {map_path(map_id)}")
+            return False
+        if map_hash and map_hash != game_map.digest:
+            print(f"Внимание: карта {map_id} отличается от карты сервера")
+        self.game = Game(create_screen=False, game_map=game_map)
+        self.game.screen = self.screen
+        self.view_center = (game_map.width / 2, game_map.height / 2)
+        print(f"Карта: {game_map.name} ({game_map.width}x{game_map.height})")
+        return True
+    
+    def update_camera(self):
+        if self.tank_id in self.game.tanks:
+            tank = self.game.tanks[self.tank_id]
+            self.camera = self.game.camera_for(tank.x, tank.y, self.screen)
+            return
+        
+        if self.spectator and self.view_center is not None:
+            # Зритель двигает обзор стрелками
+            keys = pygame.key.get_pressed()
+            x, y = self.view_center
+            x += (keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * 10
+            y += (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * 10
+            x = min(max(0, x), self.game.map.width)
+            y = min(max(0, y), self.game.map.height)
+            self.view_center = (x, y)
+            self.camera = self.game.camera_for(x, y, self.screen)
+    
     def send_message(self, message):
+        """Немедленная отправка (ответ на ping, чтобы не искажать RTT)"""
+        self.send_frames([(json.dumps(message) + '\n').encode('utf-8')])
+    
+    def queue_message(self, message):
+        self.outbox.append((json.dumps(message) + '\n').encode('utf-8'))
+    
+    def flush_messages(self):
+        if self.outbox:
+            frames, self.outbox = self.outbox, []
+            self.send_frames(frames)
+    
+    def send_frames(self, frames):
         if self.socket:
             try:
-                self.socket.sendall((json.dumps(message) + '\n').encode('utf-8'))
+                # Отправляют два потока: игровой цикл и поток получения (pong)
+                with self.send_lock:
+                    send_frames(self.socket, frames)
             except Exception as e:
                 print(f"Ошибка отправки сообщения: {e}")
     
     def receive_loop(self):
-        buffer = ''
         while self.running:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
-                if not data:
-                    break
+                if b'\n' not in self.recv_buffer:
+                    data = self.socket.recv(65536)
+                    if not data:
+                        break
+                    self.recv_buffer += data
                 
-                buffer += data
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if line.strip():
-                        try:
-                            message = json.loads(line)
-                            if message['type'] == 'state':
-                                self.last_state = message['data']
-                        except json.JSONDecodeError:
-                            continue
+                end = self.recv_buffer.rfind(b'\n')
+                if end < 0:
+                    continue
+                frames = self.recv_buffer[:end].split(b'\n')
+                self.recv_buffer = self.recv_buffer[end + 1:]
+                
+                # Полные снимки, пришедшие между кадрами отрисовки, не разбираются:
+                # каждый новый заменяет все предыдущие. Остальные сообщения обрабатываем все
+                states = None
+                for frame in frames:
+                    if frame.startswith(PARTIAL_PREFIX):
+                        if states is None:
+                            states = []
+                        states.append(frame)
+                    elif frame.startswith(STATE_PREFIX):
+                        states = [frame]
+                    elif frame.strip():
+                        self.handle_message(frame)
+                
+                if states is not None:
+                    with self.state_lock:
+                        if states[0].startswith(PARTIAL_PREFIX):
+                            self.pending_states.extend(states)
+                        else:
+                            self.pending_states = states
             
             except Exception as e:
                 if self.running:
                     print(f"Ошибка получения данных: {e}")
                 break
     
+    def handle_message(self, frame):
+        try:
+            message = json.loads(frame)
+        except json.JSONDecodeError:
+            return
+        
+        if message['type'] == 'ping':
+            # Сервер измеряет RTT для подбора частоты снимков
+            self.send_message({'type': 'pong', 't': message['t']})
+    
+    def take_states(self):
+        """Декодирует снимки, полученные после примененного, в порядке прихода"""
+        with self.state_lock:
+            frames = self.pending_states
+            self.pending_states = []
+        states = []
+        for frame in frames:
+            try:
+                states.append(json.loads(frame)['data'])
+            except (json.JSONDecodeError, KeyError):
+                continue
+        return states
+    
     def handle_input(self):
         keys = pygame.key.get_pressed()
         
         if self.tank_id is None:
             return
         
-        # Всегда отправляем обновление угла, даже если танк еще не создан
+        # Всегда отправляем обновление угла, даже если танк еще не создан.
+        # Мышь переводится в координаты арены с учетом камеры
         mouse_x, mouse_y = pygame.mouse.get_pos()
+        mouse_x += self.camera[0]
+        mouse_y += self.camera[1]
         
         # Получаем текущие координаты танка из состояния игры
         if self.tank_id in self.game.tanks:
@@ -111,7 +246,8 @@ class GameClient:
             tank_x, tank_y = tank.x, tank.y
         else:
             # Если танк еще не создан, используем центр экрана
-            tank_x, tank_y = 400, 300
+            tank_x = self.camera[0] + self.screen.get_width() // 2
+            tank_y = self.camera[1] + self.screen.get_height() // 2
         
         dx, dy = 0, 0
         
@@ -130,7 +266,7 @@ class GameClient:
         
         # Отправляем обновление, если есть движение или значительное изменение угла
         if dx != 0 or dy != 0:
-            self.send_message({
+            self.queue_message({
                 'type': 'move',
                 'dx': dx,
                 'dy': dy,
@@ -139,7 +275,7 @@ class GameClient:
         elif self.tank_id in self.game.tanks:
             tank = self.game.tanks[self.tank_id]
             if abs(angle - tank.angle) > 0.05:
-                self.send_message({
+                self.queue_message({
                     'type': 'move',
                     'dx': 0,
                     'dy': 0,
@@ -159,29 +295,33 @@ class GameClient:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
+                elif self.spectator:
+                    continue  # Зритель не управляет игрой
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1:  # Левая кнопка мыши
                         if not self.game.game_ended:
-                            self.send_message({'type': 'shoot'})
+                            self.queue_message({'type': 'shoot'})
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:  # Клавиша R для перезапуска
                         print("Запрос перезапуска игры...")
-                        self.send_message({'type': 'restart'})
+                        self.queue_message({'type': 'restart'})
+            
+            # Применение состояния от сервера
+            for state in self.take_states():
+                self.game.set_state(state)
             
-            # Применение последнего состояния от сервера
-            if self.last_state:
-                self.game.set_state(self.last_state)
-                self.last_state = None
+            self.update_camera()
             
             # Обработка ввода только если игра не окончена
-            if not self.game.game_ended:
+            if not self.game.game_ended and not self.spectator:
                 self.handle_input()
+            self.flush_messages()
             
             # Отрисовка
             if self.game.game_ended:
                 self.game.draw_game_over(self.screen, self.font)
             else:
-                self.game.draw(screen=self.screen, font=self.font)
+                self.game.draw(screen=self.screen, font=self.font, camera=self.camera)
             
             self.clock.tick(60)
         
@@ -192,7 +332,36 @@ class GameClient:
 if __name__ == '__main__':
     import sys
     
-    server_host = sys.argv[1] if len(sys.argv) > 1 else HOST
-    client = GameClient(server_host)
+    # python client.py [адрес] [--spectate [порт]]
+    args = sys.argv[1:]
+    spectator = '--spectate' in args
+    port = PORT
+    if spectator:
+        index = args.index('--spectate')
+        port = SPECTATOR_PORT
+        # Порт необязателен: следующий аргумент может быть адресом или другим флагом
+        if index + 1 < len(args) and args[index + 1].isdigit():
+            port = int(args.pop(index + 1))
+        args.pop(index)
+    
+    # --sndbuf N, --rcvbuf N: размеры буферов сокета в байтах
+    send_buffer, recv_buffer = parse_buffer_args(args)
+    # --region R, --rating N: данные для подбора соперников в лобби
+    # --name NAME: имя игрока в статистике матчей
+    region = rating = name = None
+    if '--region' in args:
+        index = args.index('--region')
+        region = args.pop(index + 1)
+        args.pop(index)
+    if '--rating' in args:
+        index = args.index('--rating')
+        rating = int(args.pop(index + 1))
+        args.pop(index)
+    if '--name' in args:
+        index = args.index('--name')
+        name = args.pop(index + 1)
+        args.pop(index)
+    server_host = args[0] if args else HOST
+    client = GameClient(server_host, port, spectator, send_buffer, recv_buffer, region, rating, name)
     client.run()
 
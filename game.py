@@ -1,50 +1,86 @@
 import pygame
 import math
 import json
+import time
+from maps import load_map, DEFAULT_MAP
 
 # Инициализация pygame (будет выполнена при создании экрана)
 
 # Константы
-SCREEN_WIDTH = 800
+SCREEN_WIDTH = 800  # Размер окна; размер арены задается картой
 SCREEN_HEIGHT = 600
 TANK_SIZE = 30
 TANK_SPEED = 3
 BULLET_SIZE = 5
-BULLET_SPEED = 8
+BULLET_SPEED = 8  # Пикселей за тик при 30 тиках в секунду
+BULLET_VELOCITY = BULLET_SPEED * 30  # Пикселей в секунду
 WALL_COLOR = (100, 100, 100)
-SPAWN_POINTS = [(50, 50), (750, 550)]
+BOT_ID_BASE = 1000  # Боты получают id из отдельного диапазона, чтобы не пересекаться с игроками
 
 # Цвета танков
 TANK_COLORS = [(255, 0, 0), (0, 0, 255)]  # Красный и синий
 
+def segment_hit_time(x0, y0, x1, y1, rect, pad=0):
+    """Доля пути от (x0, y0) до (x1, y1), на которой отрезок входит в rect,
+    расширенный на pad со всех сторон, или None, если не пересекает
+    """
+    t_enter, t_exit = 0.0, 1.0
+    for start, delta, low, high in ((x0, x1 - x0, rect.left - pad, rect.right + pad),
+                                    (y0, y1 - y0, rect.top - pad, rect.bottom + pad)):
+        if delta == 0:
+            if start <= low or start >= high:
+                return None
+            continue
+        t_low = (low - start) / delta
+        t_high = (high - start) / delta
+        if t_low > t_high:
+            t_low, t_high = t_high, t_low
+        t_enter = max(t_enter, t_low)
+        t_exit = min(t_exit, t_high)
+        if t_enter >= t_exit:
+            return None
+    return t_enter
+
 class Wall:
     def __init__(self, x, y, width, height):
         self.rect = pygame.Rect(x, y, width, height)
     
-    def draw(self, screen):
-        pygame.draw.rect(screen, WALL_COLOR, self.rect)
+    def draw(self, screen, offset=(0, 0)):
+        pygame.draw.rect(screen, WALL_COLOR, self.rect.move(-offset[0], -offset[1]))
 
 class Bullet:
-    def __init__(self, x, y, angle, owner_id):
+    def __init__(self, x, y, angle, owner_id, bullet_id=None):
+        self.id = bullet_id  # Назначается игрой при выстреле
         self.x = x
         self.y = y
         self.angle = angle
         self.owner_id = owner_id
+        self.prev_x = x  # Положение на прошлом тике, от него считается пройденный отрезок
+        self.prev_y = y
         self.rect = pygame.Rect(x - BULLET_SIZE//2, y - BULLET_SIZE//2, BULLET_SIZE, BULLET_SIZE)
     
-    def update(self):
-        dx = math.cos(self.angle) * BULLET_SPEED
-        dy = math.sin(self.angle) * BULLET_SPEED
-        self.x += dx
-        self.y += dy
+    def update(self, dt):
+        self.prev_x = self.x
+        self.prev_y = self.y
+        self.move_to(self.x + math.cos(self.angle) * BULLET_VELOCITY * dt,
+                     self.y + math.sin(self.angle) * BULLET_VELOCITY * dt)
+    
+    def move_to(self, x, y):
+        self.x = x
+        self.y = y
         self.rect.x = self.x - BULLET_SIZE//2
         self.rect.y = self.y - BULLET_SIZE//2
     
-    def draw(self, screen):
-        pygame.draw.circle(screen, (255, 255, 0), (int(self.x), int(self.y)), BULLET_SIZE)
+    def position_at(self, t):
+        """Точка на отрезке, пройденном за последний тик (t от 0 до 1)"""
+        return self.prev_x + (self.x - self.prev_x) * t, self.prev_y + (self.y - self.prev_y) * t
+    
+    def draw(self, screen, offset=(0, 0)):
+        pygame.draw.circle(screen, (255, 255, 0), (int(self.x - offset[0]), int(self.y - offset[1])), BULLET_SIZE)
     
     def to_dict(self):
         return {
+            'id': self.id,
             'x': self.x,
             'y': self.y,
             'angle': self.angle,
@@ -53,7 +89,7 @@ class Bullet:
     
     @staticmethod
     def from_dict(data):
-        bullet = Bullet(data['x'], data['y'], data['angle'], data['owner_id'])
+        bullet = Bullet(data['x'], data['y'], data['angle'], data['owner_id'], data.get('id'))
         return bullet
 
 class Tank:
@@ -68,10 +104,13 @@ class Tank:
         self.spawn_y = y
         self.alive = True
         self.kills = 0  # Счетчик убийств
+        self.deaths = 0
+        self.bot = False  # Танком управляет сервер
+        self.player_key = None  # Под каким именем игрок попадает в статистику
         self.invulnerability_time = 2.0  # Время неуязвимости в секундах
         self.spawn_time = 0.0  # Время спавна (для отсчета неуязвимости)
     
-    def update(self, dx, dy, angle, walls, dt=0.016):
+    def update(self, dx, dy, angle, walls, dt=0.016, arena=None):
         if not self.alive:
             return
         
@@ -91,25 +130,31 @@ class Tank:
         self.rect.x = self.x - TANK_SIZE//2
         self.rect.y = self.y - TANK_SIZE//2
         
-        # Проверка столкновений
-        for wall in walls:
-            if self.rect.colliderect(wall.rect):
-                self.x = old_x
-                self.y = old_y
-                self.rect.x = self.x - TANK_SIZE//2
-                self.rect.y = self.y - TANK_SIZE//2
-                break
-        
-        # Ограничение границами экрана
-        self.x = max(TANK_SIZE//2, min(SCREEN_WIDTH - TANK_SIZE//2, self.x))
-        self.y = max(TANK_SIZE//2, min(SCREEN_HEIGHT - TANK_SIZE//2, self.y))
+        # Проверка столкновений (сетка занятости карты отсекает случаи без стен рядом)
+        if arena is None or arena.rect_may_hit(self.rect.x, self.rect.y, TANK_SIZE, TANK_SIZE):
+            for wall in walls:
+                if self.rect.colliderect(wall.rect):
+                    self.x = old_x
+                    self.y = old_y
+                    self.rect.x = self.x - TANK_SIZE//2
+                    self.rect.y = self.y - TANK_SIZE//2
+                    break
+        
+        # Ограничение границами арены
+        width = arena.width if arena else SCREEN_WIDTH
+        height = arena.height if arena else SCREEN_HEIGHT
+        self.x = max(TANK_SIZE//2, min(width - TANK_SIZE//2, self.x))
+        self.y = max(TANK_SIZE//2, min(height - TANK_SIZE//2, self.y))
         self.rect.x = self.x - TANK_SIZE//2
         self.rect.y = self.y - TANK_SIZE//2
     
-    def draw(self, screen):
+    def draw(self, screen, offset=(0, 0)):
         if not self.alive:
             return
         
+        x = self.x - offset[0]
+        y = self.y - offset[1]
+        
         # Убеждаемся, что цвет - это tuple
         color = self.color
         if isinstance(color, list):
@@ -146,18 +191,18 @@ class Tank:
                            (int(gun_end_x), int(gun_end_y)), 4)
             
             # Рисуем поверхность на экране
-            screen.blit(tank_surface, (int(self.x - TANK_SIZE//2 - 2), int(self.y - TANK_SIZE//2 - 2)))
+            screen.blit(tank_surface, (int(x - TANK_SIZE//2 - 2), int(y - TANK_SIZE//2 - 2)))
         else:
             # Обычная отрисовка
-            tank_rect = pygame.Rect(int(self.x - TANK_SIZE//2), int(self.y - TANK_SIZE//2), TANK_SIZE, TANK_SIZE)
+            tank_rect = pygame.Rect(int(x - TANK_SIZE//2), int(y - TANK_SIZE//2), TANK_SIZE, TANK_SIZE)
             pygame.draw.rect(screen, color, tank_rect)
             pygame.draw.rect(screen, (0, 0, 0), tank_rect, 2)
             
             # Пушка
             gun_length = TANK_SIZE
-            gun_end_x = self.x + math.cos(self.angle) * gun_length
-            gun_end_y = self.y + math.sin(self.angle) * gun_length
-            pygame.draw.line(screen, color, (int(self.x), int(self.y)), (int(gun_end_x), int(gun_end_y)), 4)
+            gun_end_x = x + math.cos(self.angle) * gun_length
+            gun_end_y = y + math.sin(self.angle) * gun_length
+            pygame.draw.line(screen, color, (int(x), int(y)), (int(gun_end_x), int(gun_end_y)), 4)
     
     def shoot(self):
         if not self.alive:
@@ -176,12 +221,18 @@ class Tank:
         self.alive = True
         self.spawn_time = self.invulnerability_time  # Активируем неуязвимость
     
+    def display_name(self):
+        if self.bot:
+            return f"Бот {self.id - BOT_ID_BASE + 1}"
+        return f"Игрок {self.id + 1}"
+    
     def is_invulnerable(self):
         """Проверка, неуязвим ли танк"""
         return self.spawn_time > 0
     
     def take_damage(self):
         self.alive = False
+        self.deaths += 1
         self.respawn()
     
     def to_dict(self):
@@ -195,6 +246,7 @@ class Tank:
             'spawn_y': self.spawn_y,
             'alive': self.alive,
             'kills': self.kills,
+            'bot': self.bot,
             'spawn_time': self.spawn_time
         }
     
@@ -211,6 +263,7 @@ class Tank:
         tank.spawn_y = data['spawn_y']
         tank.alive = data['alive']
         tank.kills = data.get('kills', 0)
+        tank.bot = data.get('bot', False)
         tank.spawn_time = data.get('spawn_time', 0.0)
         # Обновляем rect
         tank.rect.x = tank.x - TANK_SIZE//2
@@ -218,10 +271,13 @@ class Tank:
         return tank
 
 class Game:
-    def __init__(self, create_screen=True):
+    def __init__(self, create_screen=True, game_map=None):
+        # Карта только читается и может быть общей для нескольких игр
+        self.map = game_map if game_map is not None else load_map(DEFAULT_MAP)
         self.walls = []
         self.tanks = {}
         self.bullets = []
+        self.next_bullet_id = 0
         self.create_maze()
         self.screen = None
         if create_screen:
@@ -234,66 +290,112 @@ class Game:
         self.game_time = 60.0  # В секундах
         self.game_started = False
         self.game_ended = False
+        self.match_started_at = None
+        # Вызывается с итогами матча, когда он закончился или был прерван перезапуском
+        self.on_match_end = None
     
     def create_maze(self):
-        # Создание простого лабиринта
-        wall_thickness = 20
-        
-        # Внешние стены
-        self.walls.append(Wall(0, 0, SCREEN_WIDTH, wall_thickness))
-        self.walls.append(Wall(0, 0, wall_thickness, SCREEN_HEIGHT))
-        self.walls.append(Wall(0, SCREEN_HEIGHT - wall_thickness, SCREEN_WIDTH, wall_thickness))
-        self.walls.append(Wall(SCREEN_WIDTH - wall_thickness, 0, wall_thickness, SCREEN_HEIGHT))
-        
-        # Внутренние стены - лабиринт
-        self.walls.append(Wall(200, 100, wall_thickness, 150))
-        self.walls.append(Wall(400, 200, 150, wall_thickness))
-        self.walls.append(Wall(600, 150, wall_thickness, 200))
-        self.walls.append(Wall(150, 300, 200, wall_thickness))
-        self.walls.append(Wall(450, 350, wall_thickness, 150))
-        self.walls.append(Wall(250, 450, 300, wall_thickness))
-        self.walls.append(Wall(100, 500, 100, wall_thickness))
+        # Стены лабиринта берутся из карты (maps/<id>.json)
+        for x, y, width, height in self.map.walls:
+            self.walls.append(Wall(x, y, width, height))
     
     def add_tank(self, tank_id, spawn_index=None):
+        spawn_points = self.map.spawn_points
         if spawn_index is None:
-            spawn_index = len(self.tanks) % len(SPAWN_POINTS)
+            spawn_index = len(self.tanks) % len(spawn_points)
         
-        x, y = SPAWN_POINTS[spawn_index]
+        x, y = spawn_points[spawn_index]
         color = TANK_COLORS[tank_id % len(TANK_COLORS)]
         tank = Tank(tank_id, x, y, color)
         tank.spawn_time = tank.invulnerability_time  # Даем неуязвимость при первом спавне
         self.tanks[tank_id] = tank
         return tank
     
-    def update_bullets(self):
+    def apply_command(self, tank_id, message):
+        """Применение команды игрока (ввод, подключение, отключение)"""
+        kind = message['type']
+        
+        if kind == 'join':
+            self.add_tank(tank_id).player_key = message.get('player')
+            # Запускаем игру, если подключился второй игрок
+            if len(self.tanks) == 2 and not self.game_started:
+                self.start_game()
+                print("Игра началась! Таймер: 60 секунд")
+        
+        elif kind == 'leave':
+            if tank_id in self.tanks:
+                del self.tanks[tank_id]
+        
+        elif kind == 'move':
+            # Обновление позиции танка
+            if tank_id in self.tanks:
+                tank = self.tanks[tank_id]
+                dx = message.get('dx', 0)
+                dy = message.get('dy', 0)
+                angle = message.get('angle', tank.angle)
+                tank.update(dx, dy, angle, self.walls, 0.016, self.map)
+        
+        elif kind == 'shoot':
+            # Выстрел
+            if tank_id in self.tanks:
+                bullet = self.tanks[tank_id].shoot()
+                if bullet:
+                    self.add_bullet(bullet)
+        
+        elif kind == 'restart':
+            # Перезапуск игры
+            self.reset_game()
+            # Запускаем игру снова, если есть минимум 2 игрока
+            if len(self.tanks) >= 2:
+                self.start_game()
+                print("Игра перезапущена!")
+    
+    def add_bullet(self, bullet):
+        bullet.id = self.next_bullet_id
+        self.next_bullet_id += 1
+        self.bullets.append(bullet)
+    
+    def update_bullets(self, dt):
         bullets_to_remove = []
+        pad = BULLET_SIZE / 2
 
         for bullet in self.bullets:
-            bullet.update()
-
-            # Удаление пуль за границами
-            if bullet.x < 0 or bullet.x > SCREEN_WIDTH or bullet.y < 0 or bullet.y > SCREEN_HEIGHT:
-                bullets_to_remove.append(bullet)
-                continue
+            bullet.update(dt)
+            x0, y0, x1, y1 = bullet.prev_x, bullet.prev_y, bullet.x, bullet.y
 
-            # Проверка столкновения со стенами
-            for wall in self.walls:
-                if bullet.rect.colliderect(wall.rect):
-                    bullets_to_remove.append(bullet)
-                    break
+            # Пуля проверяется по всему отрезку, пройденному за тик, а не только
+            # по конечной точке, поэтому не пролетает сквозь стены и танки при
+            # низкой частоте тиков. Срабатывает то столкновение, что случилось раньше
+            hit_time, hit_tank = None, None
+            left, top = min(x0, x1) - pad, min(y0, y1) - pad
+            if self.map.rect_may_hit(left, top, abs(x1 - x0) + BULLET_SIZE, abs(y1 - y0) + BULLET_SIZE):
+                for wall in self.walls:
+                    t = segment_hit_time(x0, y0, x1, y1, wall.rect, pad)
+                    if t is not None and (hit_time is None or t < hit_time):
+                        hit_time = t
 
             # Проверка попадания в танк (только если игра не окончена)
             if not self.game_ended:
-                for tank_id, tank in self.tanks.items():
-                    if (tank.id != bullet.owner_id and tank.alive and
-                        bullet.rect.colliderect(tank.rect) and
-                        not tank.is_invulnerable()):  # Проверка неуязвимости
-                        # Увеличиваем счетчик убийств у владельца пули
-                        if bullet.owner_id in self.tanks:
-                            self.tanks[bullet.owner_id].kills += 1
-                        tank.take_damage()
-                        bullets_to_remove.append(bullet)
-                        break
+                for tank in self.tanks.values():
+                    if tank.id == bullet.owner_id or not tank.alive or tank.is_invulnerable():
+                        continue
+                    t = segment_hit_time(x0, y0, x1, y1, tank.rect, pad)
+                    if t is not None and (hit_time is None or t < hit_time):
+                        hit_time, hit_tank = t, tank
+
+            if hit_time is not None:
+                bullet.move_to(*bullet.position_at(hit_time))
+                if hit_tank is not None:
+                    # Увеличиваем счетчик убийств у владельца пули
+                    if bullet.owner_id in self.tanks:
+                        self.tanks[bullet.owner_id].kills += 1
+                    hit_tank.take_damage()
+                bullets_to_remove.append(bullet)
+                continue
+
+            # Удаление пуль за границами
+            if bullet.x < 0 or bullet.x > self.map.width or bullet.y < 0 or bullet.y > self.map.height:
+                bullets_to_remove.append(bullet)
 
         for bullet in bullets_to_remove:
             self.bullets.remove(bullet)
@@ -304,6 +406,7 @@ class Game:
             if self.game_time <= 0:
                 self.game_time = 0
                 self.game_ended = True
+                self.finish_match(completed=True)
         
         # Обновление танков (для таймера неуязвимости)
         for tank in self.tanks.values():
@@ -314,15 +417,52 @@ class Game:
                     if tank.spawn_time < 0:
                         tank.spawn_time = 0
         
-        self.update_bullets()
+        self.update_bullets(dt)
     
     def start_game(self):
         self.game_started = True
         self.game_ended = False
         self.game_time = 60.0
+        self.match_started_at = time.time()
+    
+    def finish_match(self, completed):
+        if self.on_match_end is None or self.match_started_at is None:
+            return
+        self.on_match_end(self.match_summary(completed))
+        self.match_started_at = None
+    
+    def match_summary(self, completed):
+        """Итоги матча для статистики"""
+        ended_at = time.time()
+        top_kills = max((tank.kills for tank in self.tanks.values()), default=0)
+        leaders = sum(1 for tank in self.tanks.values() if tank.kills == top_kills)
+        players = []
+        for tank in self.tanks.values():
+            players.append({
+                'player_key': tank.player_key or f"tank-{tank.id}",
+                'tank_id': tank.id,
+                'is_bot': tank.bot,
+                'anonymous': tank.player_key is None,
+                'kills': tank.kills,
+                'deaths': tank.deaths,
+                # Победитель - единственный лидер по убийствам в завершенном матче
+                'won': completed and top_kills > 0 and leaders == 1 and tank.kills == top_kills
+            })
+        return {
+            'map_name': self.map.name,
+            'started_at': self.match_started_at,
+            'ended_at': ended_at,
+            'duration': ended_at - self.match_started_at,
+            'completed': completed,
+            'players': players
+        }
     
     def reset_game(self):
         """Сброс игры: очистка пуль, сброс позиций танков, счетчиков и таймера"""
+        # Прерванный матч тоже попадает в статистику
+        if self.game_started and not self.game_ended:
+            self.finish_match(completed=False)
+        
         # Очистка пуль
         self.bullets = []
         
@@ -333,6 +473,7 @@ class Game:
             tank.angle = 0
             tank.alive = True
             tank.kills = 0  # Сброс счетчика убийств
+            tank.deaths = 0
             tank.spawn_time = tank.invulnerability_time  # Активируем неуязвимость при перезапуске
             tank.rect.x = tank.x - TANK_SIZE//2
             tank.rect.y = tank.y - TANK_SIZE//2
@@ -345,7 +486,14 @@ class Game:
     def get_time_remaining(self):
         return max(0, self.game_time)
     
-    def draw(self, screen=None, font=None):
+    def camera_for(self, x, y, screen):
+        """Смещение камеры, чтобы точка была в центре экрана, не выходя за арену"""
+        view_width, view_height = screen.get_size()
+        camera_x = min(max(0, int(x) - view_width // 2), max(0, self.map.width - view_width))
+        camera_y = min(max(0, int(y) - view_height // 2), max(0, self.map.height - view_height))
+        return camera_x, camera_y
+    
+    def draw(self, screen=None, font=None, camera=(0, 0)):
         if screen is None:
             screen = self.screen
         
@@ -356,15 +504,15 @@ class Game:
         
         # Рисование стен
         for wall in self.walls:
-            wall.draw(screen)
+            wall.draw(screen, camera)
         
         # Рисование танков
         for tank in self.tanks.values():
-            tank.draw(screen)
+            tank.draw(screen, camera)
         
         # Рисование пуль
         for bullet in self.bullets:
-            bullet.draw(screen)
+            bullet.draw(screen, camera)
         
         # Рисование UI (таймер и счет)
         if font:
@@ -379,7 +527,7 @@ class Game:
                 if isinstance(color, list):
                     color = tuple(color)
                 
-                kills_text = f"Игрок {tank_id + 1}: {tank.kills} убийств"
+                kills_text = f"{tank.display_name()}: {tank.kills} убийств"
                 kills_surface = font.render(kills_text, True, color)
                 screen.blit(kills_surface, (10, y_offset))
                 y_offset += 30
@@ -388,7 +536,7 @@ class Game:
             if not self.game_started or self.game_ended:
                 hint_text = "Нажмите R для перезапуска игры"
                 hint_surface = font.render(hint_text, True, (200, 200, 200))
-                screen.blit(hint_surface, (10, SCREEN_HEIGHT - 40))
+                screen.blit(hint_surface, (10, screen.get_height() - 40))
         
         pygame.display.flip()
     
@@ -425,7 +573,7 @@ class Game:
             if isinstance(color, list):
                 color = tuple(color)
             
-            rank_text = f"{rank}. Игрок {tank_id + 1}: {tank.kills} убийств"
+            rank_text = f"{rank}. {tank.display_name()}: {tank.kills} убийств"
             rank_surface = font.render(rank_text, True, color)
             rank_rect = rank_surface.get_rect(center=(SCREEN_WIDTH//2, y_offset))
             screen.blit(rank_surface, rank_rect)
@@ -435,7 +583,7 @@ class Game:
         if len(sorted_tanks) > 0:
             winner_id, winner = sorted_tanks[0]
             if winner.kills > 0:
-                winner_text = f"ПОБЕДИТЕЛЬ: Игрок {winner_id + 1}!"
+                winner_text = f"ПОБЕДИТЕЛЬ: {winner.display_name()}!"
                 winner_color = winner.color
                 if isinstance(winner_color, list):
                     winner_color = tuple(winner_color)
@@ -466,6 +614,20 @@ class Game:
         }
     
     def set_state(self, state):
+        # Частичный снимок содержит только часть сущностей (см. bandwidth.SnapshotPacker),
+        # а списки removed_tanks и removed_bullets - исчезнувшие с прошлых снимков
+        partial = state.get('partial', False)
+        
+        # Удаление танков, которых больше нет на сервере (отключившиеся игроки, убранные боты)
+        if partial:
+            for tid in state.get('removed_tanks', []):
+                self.tanks.pop(tid, None)
+        elif 'tanks' in state:
+            present = {int(tid) for tid in state['tanks']}
+            for tid in list(self.tanks):
+                if tid not in present:
+                    del self.tanks[tid]
+        
         # Обновление или создание танков
         for tid, tank_data in state.get('tanks', {}).items():
             tid = int(tid)  # Убеждаемся, что это int
@@ -486,7 +648,15 @@ class Game:
                 self.tanks[tid] = tank
         
         # Обновление пуль
-        self.bullets = [Bullet.from_dict(b) for b in state.get('bullets', [])]
+        if partial:
+            # Пули, не попавшие в снимок, остаются с прошлыми данными
+            gone = set(state.get('removed_bullets', []))
+            bullets = {b.id: b for b in self.bullets if b.id not in gone}
+            for b in state.get('bullets', []):
+                bullets[b['id']] = Bullet.from_dict(b)
+            self.bullets = list(bullets.values())
+        else:
+            self.bullets = [Bullet.from_dict(b) for b in state.get('bullets', [])]
         
         # Обновление состояния игры
         if 'game_time' in state:
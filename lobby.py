@@ -0,0 +1,290 @@
+import json
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+from transport import configure_socket
+
+LOBBY_BACKLOG = 4096  # Очередь ядра на всплеск подключений к началу события
+ACCEPT_BATCH = 256  # Сколько подключений принимается за одно пробуждение
+HELLO_TIMEOUT = 1.0  # Сколько ждать hello, прежде чем поставить игрока в очередь с настройками по умолчанию
+HELLO_MAX_BYTES = 512
+# Имя уходит в симуляцию в сообщении join; в режиме --multiprocess оно должно
+# поместиться в слот очереди ввода (simprocess.INPUT_SLOT_SIZE) вместе с остальными полями
+NAME_MAX_BYTES = 200  # Длина имени в JSON: кириллица занимает 6 байт на символ, символы вне BMP - 12
+DEFAULT_REGION = 'any'
+DEFAULT_RATING = 1000
+RATING_BUCKET = 100  # Ширина корзины рейтинга
+WIDEN_INTERVAL = 5.0  # Каждые столько секунд ожидания поиск расширяется на соседнюю корзину
+MAX_WIDEN = 5
+REGION_FALLBACK_TIME = 15.0  # После стольких секунд ожидания подходит соперник из любого региона
+MATCH_SEATS = 8  # Сколько игроков вмещает матч
+
+
+class Waiting:
+    """Подключение, ожидающее места в матче"""
+
+    def __init__(self, conn, addr, now):
+        self.conn = conn
+        self.addr = addr
+        self.since = now
+        self.hello_deadline = now + HELLO_TIMEOUT
+        self.buffer = b''
+        self.region = DEFAULT_REGION
+        self.rating = DEFAULT_RATING
+        self.name = None  # Имя игрока для статистики, если клиент его сообщил
+        self.queued = False
+        self.active = True  # False - ушел из очереди; удаляется из корзины лениво
+
+    @property
+    def key(self):
+        return self.region, self.rating // RATING_BUCKET
+
+    def profile(self):
+        return {'region': self.region, 'rating': self.rating, 'name': self.name}
+
+
+class MatchQueue:
+    """Очередь ожидающих, разложенная по корзинам (регион, рейтинг).
+
+    Поиск пары смотрит только головы корзин и их соседей, поэтому его
+    стоимость зависит от числа корзин, а не от числа ожидающих.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # (регион, корзина рейтинга) -> deque ожидающих
+        self.regions = {}  # регион -> число непустых корзин
+        self.size = 0
+
+    def add(self, entry):
+        bucket = self.buckets.get(entry.key)
+        if bucket is None:
+            bucket = self.buckets[entry.key] = deque()
+            self.regions[entry.region] = self.regions.get(entry.region, 0) + 1
+        bucket.append(entry)
+        self.size += 1
+
+    def remove(self, entry):
+        # Ждущие hello в очередь еще не добавлены и в size не учтены
+        if entry.active and entry.queued:
+            self.size -= 1
+        entry.active = False
+
+    def head(self, key):
+        bucket = self.buckets.get(key)
+        while bucket and not bucket[0].active:
+            bucket.popleft()
+        if bucket is None or bucket:
+            return bucket
+        del self.buckets[key]
+        region = key[0]
+        self.regions[region] -= 1
+        if not self.regions[region]:
+            del self.regions[region]
+        return None
+
+    def candidate_keys(self, anchor, now):
+        waited = now - anchor.since
+        region, bucket = anchor.key
+        regions = [region]
+        if waited >= REGION_FALLBACK_TIME:
+            regions += [other for other in self.regions if other != region]
+        widen = min(MAX_WIDEN, int(waited // WIDEN_INTERVAL))
+        for distance in range(widen + 1):
+            for other in regions:
+                yield other, bucket - distance
+                if distance:
+                    yield other, bucket + distance
+
+    def pop_group(self, size, now):
+        """Забирает группу из size совместимых игроков или возвращает None"""
+        # Кандидаты в якоря - головы корзин, дольше всех ждущие первыми
+        heads = []
+        for key in list(self.buckets):
+            bucket = self.head(key)
+            if bucket:
+                heads.append(bucket[0])
+        heads.sort(key=lambda entry: entry.since)
+
+        for anchor in heads:
+            group = [anchor]
+            for key in self.candidate_keys(anchor, now):
+                bucket = self.head(key)
+                if not bucket:
+                    continue
+                for entry in bucket:
+                    if len(group) == size:
+                        break
+                    if entry.active and entry is not anchor:
+                        group.append(entry)
+                if len(group) == size:
+                    break
+            if len(group) == size:
+                for entry in group:
+                    self.remove(entry)
+                return group
+        return None
+
+
+class Lobby:
+    """Прием подключений игроков и подбор соперников до входа в матч.
+
+    Один поток на селекторе принимает подключения без блокировок и держит
+    ожидающих, пока в матче нет мест. Когда места есть, группа игроков
+    передается серверу через admit(conn, addr, profile); дальше каждым
+    игроком занимается его поток, так что поток тиков подключения не ждет.
+    Матч у сервера один, поэтому подбор группы определяет только порядок
+    входа: впущенные группы играют в общем матче.
+    """
+
+    def __init__(self, host, port, admit, seats=MATCH_SEATS, group_size=2, send_buffer=None, recv_buffer=None):
+        self.admit = admit
+        self.seats = seats
+        self.group_size = group_size  # Сколько игроков начинают матч: 2 - пара; 1 - если соперниками будут боты
+        self.send_buffer = send_buffer
+        self.recv_buffer = recv_buffer
+        self.selector = selectors.DefaultSelector()
+        self.queue = MatchQueue()
+        self.greeting = deque()  # Ждут hello, в порядке подключения (дедлайны растут)
+        self.waiting = {}  # fileno -> Waiting
+        self.in_match = 0
+        self.seats_lock = threading.Lock()  # Места освобождают потоки клиентов
+        self.closed = False
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Принятые соединения наследуют размеры буферов слушающего сокета
+        configure_socket(self.socket, send_buffer, recv_buffer)
+        self.socket.bind((host, port))
+        self.socket.listen(LOBBY_BACKLOG)
+        self.socket.setblocking(False)
+        self.selector.register(self.socket, selectors.EVENT_READ, None)
+
+    def release(self):
+        """Игрок покинул матч - место снова свободно"""
+        with self.seats_lock:
+            self.in_match -= 1
+
+    def accept(self, now):
+        for _ in range(ACCEPT_BATCH):
+            try:
+                conn, addr = self.socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # Например, кончились файловые дескрипторы - не роняем лобби
+                print(f"Ошибка принятия подключения: {e}")
+                return
+            configure_socket(conn, self.send_buffer, self.recv_buffer)
+            conn.setblocking(False)
+            entry = Waiting(conn, addr, now)
+            self.waiting[conn.fileno()] = entry
+            self.greeting.append(entry)
+            self.selector.register(conn, selectors.EVENT_READ, entry)
+
+    def read(self, entry):
+        try:
+            data = entry.conn.recv(HELLO_MAX_BYTES)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.drop(entry)
+            return
+        if entry.queued:
+            return  # До входа в матч клиенту нечего отправлять
+        entry.buffer += data
+        if b'\n' in entry.buffer:
+            line = entry.buffer.split(b'\n', 1)[0]
+            self.parse_hello(entry, line)
+            self.enqueue(entry)
+        elif len(entry.buffer) >= HELLO_MAX_BYTES:
+            self.enqueue(entry)
+
+    @staticmethod
+    def parse_hello(entry, line):
+        # hello необязателен и не доверенный: неверные поля заменяются значениями по умолчанию
+        try:
+            message = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return
+        if not isinstance(message, dict) or message.get('type') != 'hello':
+            return
+        region = message.get('region')
+        if isinstance(region, str) and 0 < len(region) <= 16:
+            entry.region = region
+        rating = message.get('rating')
+        if isinstance(rating, int) and not isinstance(rating, bool):
+            entry.rating = max(0, min(rating, 10000))
+        name = message.get('name')
+        if isinstance(name, str) and 0 < len(name.strip()) <= 32 and len(json.dumps(name.strip())) <= NAME_MAX_BYTES:
+            entry.name = name.strip()
+
+    def enqueue(self, entry):
+        entry.queued = True
+        entry.buffer = b''
+        self.queue.add(entry)
+        try:
+            entry.conn.send(b'{"type": "queued"}\n')
+        except OSError:
+            pass
+
+    def drop(self, entry):
+        self.waiting.pop(entry.conn.fileno(), None)
+        self.queue.remove(entry)
+        self.selector.unregister(entry.conn)
+        entry.conn.close()
+
+    def expire_greetings(self, now):
+        while self.greeting and (self.greeting[0].hello_deadline <= now or self.greeting[0].queued
+                                 or not self.greeting[0].active):
+            entry = self.greeting.popleft()
+            if entry.active and not entry.queued:
+                self.enqueue(entry)
+
+    def hand_off(self, now):
+        while True:
+            with self.seats_lock:
+                free = self.seats - self.in_match
+                # Пара нужна только для начала матча; в идущий матч входят по одному
+                size = self.group_size if self.in_match == 0 else 1
+            if self.queue.size < size or free < size:
+                return
+            group = self.queue.pop_group(size, now)
+            if group is None:
+                return
+            with self.seats_lock:
+                self.in_match += len(group)
+            for entry in group:
+                self.waiting.pop(entry.conn.fileno(), None)
+                self.selector.unregister(entry.conn)
+                entry.conn.setblocking(True)
+                self.admit(entry.conn, entry.addr, entry.profile())
+
+    def run(self, stop_event):
+        try:
+            while not stop_event.is_set():
+                for key, _ in self.selector.select(0.05):
+                    now = time.monotonic()
+                    if key.data is None:
+                        self.accept(now)
+                    else:
+                        self.read(key.data)
+                now = time.monotonic()
+                self.expire_greetings(now)
+                self.hand_off(now)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for entry in list(self.waiting.values()):
+            entry.conn.close()
+        self.waiting.clear()
+        self.socket.close()
+        self.selector.close()
@@ -0,0 +1,138 @@
+import base64
+import hashlib
+import json
+import os
+import string
+import sys
+import threading
+
+MAPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maps')
+DEFAULT_MAP = 'default'
+DEFAULT_CELL_SIZE = 10
+MAP_ID_CHARS = frozenset(string.ascii_letters + string.digits + '_-')
+
+_cache = {}  # sha256 файла -> MapData
+_cache_lock = threading.Lock()
+
+
+class MapData:
+    """Карта уровня: стены, точки спавна и битовая сетка занятости.
+
+    Объект только для чтения: комнаты с одной и той же картой делят один экземпляр.
+    """
+
+    def __init__(self, digest, data):
+        self.digest = digest
+        self.name = data.get('name', '')
+        self.width = data['width']
+        self.height = data['height']
+        self.walls = tuple(tuple(wall) for wall in data['walls'])
+        self.spawn_points = tuple(tuple(point) for point in data['spawn_points'])
+        self.cell_size = data.get('cell_size', DEFAULT_CELL_SIZE)
+        self.cols = -(-self.width // self.cell_size)
+        self.rows = -(-self.height // self.cell_size)
+        self.occupancy = None
+        if 'occupancy' not in data:
+            print(f"Карта {self.name} не скомпилирована, сетка занятости строится при загрузке")
+        elif data.get('occupancy_hash') != occupancy_hash(self.width, self.height, self.cell_size, self.walls):
+            # Стены или размеры правили без python maps.py - сетка им уже не соответствует
+            print(f"Сетка занятости карты {self.name} устарела, строится заново; пересчитайте ее: python maps.py")
+        else:
+            self.occupancy = base64.b64decode(data['occupancy'])
+        if self.occupancy is None:
+            self.occupancy = build_occupancy(self.walls, self.cols, self.rows, self.cell_size)
+
+    def is_solid(self, col, row):
+        if col < 0 or row < 0 or col >= self.cols or row >= self.rows:
+            return True
+        index = row * self.cols + col
+        return bool(self.occupancy[index >> 3] & (1 << (index & 7)))
+
+    def rect_may_hit(self, left, top, width, height):
+        """Быстрая проверка: пересекает ли прямоугольник клетку со стеной.
+
+        False гарантирует отсутствие столкновения; True означает, что нужна
+        точная проверка по прямоугольникам стен.
+        """
+        size = self.cell_size
+        col0 = int(left // size)
+        row0 = int(top // size)
+        col1 = int((left + width - 1) // size)
+        row1 = int((top + height - 1) // size)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                if self.is_solid(col, row):
+                    return True
+        return False
+
+
+def build_occupancy(walls, cols, rows, cell_size):
+    bits = bytearray((cols * rows + 7) // 8)
+    for x, y, width, height in walls:
+        col0, row0 = max(0, x // cell_size), max(0, y // cell_size)
+        col1 = min(cols - 1, (x + width - 1) // cell_size)
+        row1 = min(rows - 1, (y + height - 1) // cell_size)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                index = row * cols + col
+                bits[index >> 3] |= 1 << (index & 7)
+    return bytes(bits)
+
+
+def occupancy_hash(width, height, cell_size, walls):
+    """Хеш всего, из чего строится сетка занятости; хранится рядом с ней"""
+    source = json.dumps([width, height, cell_size, [list(wall) for wall in walls]])
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+
+
+def format_map(data):
+    # Каждое поле и каждая стена на своей строке, чтобы карты было удобно править руками
+    lines = []
+    for key, value in data.items():
+        if isinstance(value, list) and value and isinstance(value[0], list):
+            items = ',\n'.join(f'    {json.dumps(item)}' for item in value)
+            lines.append(f'  {json.dumps(key)}: [\n{items}\n  ]')
+        else:
+            lines.append(f'  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}')
+    return '{\n' + ',\n'.join(lines) + '\n}\n'
+
+
+def map_path(map_id):
+    # Клиент получает id карты от сервера: это только имя файла в maps/, без путей
+    if not isinstance(map_id, str) or not map_id or not MAP_ID_CHARS.issuperset(map_id):
+        raise ValueError(f"Недопустимый id карты: {map_id!r}")
+    return os.path.join(MAPS_DIR, f'{map_id}.json')
+
+
+def load_map(map_id=DEFAULT_MAP):
+    """Загрузка карты по id; одинаковые файлы разбираются один раз"""
+    with open(map_path(map_id), 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    with _cache_lock:
+        game_map = _cache.get(digest)
+        if game_map is None:
+            game_map = MapData(digest, json.loads(raw))
+            _cache[digest] = game_map
+    return game_map
+
+
+def compile_map(path):
+    """Пересчитывает сетку занятости карты и записывает ее в файл"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    cell_size = data.setdefault('cell_size', DEFAULT_CELL_SIZE)
+    cols = -(-data['width'] // cell_size)
+    rows = -(-data['height'] // cell_size)
+    occupancy = build_occupancy([tuple(wall) for wall in data['walls']], cols, rows, cell_size)
+    data['occupancy'] = base64.b64encode(occupancy).decode('ascii')
+    data['occupancy_hash'] = occupancy_hash(data['width'], data['height'], cell_size, data['walls'])
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(format_map(data))
+    print(f"{path}: {cols}x{rows} клеток по {cell_size} px, стен: {len(data['walls'])}")
+
+
+if __name__ == '__main__':
+    # python maps.py maps/<карта>.json ... - компиляция сетки занятости
+    for path in sys.argv[1:]:
+        compile_map(path)
@@ -0,0 +1,218 @@
+import json
+import selectors
+import socket
+import sys
+import time
+from collections import deque
+
+from transport import configure_socket
+
+HOST = '0.0.0.0'
+SPECTATOR_PORT = 5556  # Порт зрителей игрового сервера
+RELAY_PORT = 5557
+VIEWER_MAX_PENDING = 4  # Сколько снимков держим для медленного зрителя, прежде чем сбросить старые
+RECONNECT_INTERVAL = 1.0
+
+
+class Viewer:
+    """Зритель ретранслятора со своей очередью исходящих кадров"""
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.initialized = False
+        self.pending = deque()
+        self.current = None  # Недоотправленный кадр (memoryview)
+
+    def enqueue(self, frame):
+        if len(self.pending) >= VIEWER_MAX_PENDING:
+            # Зритель не успевает - устаревшие снимки ему уже не нужны
+            self.pending.clear()
+        self.pending.append(frame)
+
+    def has_data(self):
+        return self.current is not None or bool(self.pending)
+
+    def flush(self):
+        """Отправляет сколько примет сокет, не блокируясь"""
+        while True:
+            if self.current is None:
+                if not self.pending:
+                    return
+                self.current = memoryview(self.pending.popleft())
+            try:
+                sent = self.conn.send(self.current)
+            except BlockingIOError:
+                return
+            self.current = self.current[sent:]
+            if not self.current:
+                self.current = None
+
+
+class SpectatorRelay:
+    """Ретранслятор: одна подписка на поток снимков матча, раздача многим зрителям.
+
+    Кадры пересылаются в том виде, в каком пришли от сервера, без декодирования,
+    поэтому нагрузка на игровой сервер не зависит от числа зрителей.
+    """
+
+    def __init__(self, upstream_host, upstream_port=SPECTATOR_PORT, listen_port=RELAY_PORT, delay=0.0):
+        self.upstream_address = (upstream_host, upstream_port)
+        self.delay = delay
+        self.selector = selectors.DefaultSelector()
+        self.running = True
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((HOST, listen_port))
+        self.socket.listen(128)
+        self.socket.setblocking(False)
+        self.selector.register(self.socket, selectors.EVENT_READ, 'accept')
+
+        self.upstream = None
+        self.upstream_buffer = b''
+        self.next_reconnect = 0.0
+        self.delayed = deque()  # (время получения, кадр)
+        self.latest_frame = None
+        self.map_info = {}  # id и хеш карты из init сервера
+        self.viewers = {}
+        print(f"Ретранслятор слушает {HOST}:{listen_port}, источник {upstream_host}:{upstream_port}, задержка {delay}s")
+
+    def connect_upstream(self):
+        try:
+            upstream = socket.create_connection(self.upstream_address, timeout=2)
+        except OSError as e:
+            print(f"Нет соединения с сервером: {e}")
+            self.next_reconnect = time.monotonic() + RECONNECT_INTERVAL
+            return
+        configure_socket(upstream)
+        upstream.setblocking(False)
+        self.upstream = upstream
+        self.upstream_buffer = b''
+        self.selector.register(upstream, selectors.EVENT_READ, 'upstream')
+        print("Подписка на поток снимков установлена")
+
+    def drop_upstream(self):
+        self.selector.unregister(self.upstream)
+        self.upstream.close()
+        self.upstream = None
+        self.next_reconnect = time.monotonic() + RECONNECT_INTERVAL
+        print("Соединение с сервером потеряно")
+
+    def read_upstream(self):
+        try:
+            data = self.upstream.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.drop_upstream()
+            return
+
+        now = time.monotonic()
+        self.upstream_buffer += data
+        *frames, self.upstream_buffer = self.upstream_buffer.split(b'\n')
+        for frame in frames:
+            if frame.startswith(b'{"type": "state"'):
+                self.delayed.append((now, frame + b'\n'))
+            elif frame.startswith(b'{"type": "init"'):
+                init = json.loads(frame)
+                self.map_info = {key: init[key] for key in ('map_id', 'map_hash') if key in init}
+
+    def release_frames(self, now):
+        while self.delayed and self.delayed[0][0] + self.delay <= now:
+            _, frame = self.delayed.popleft()
+            self.latest_frame = frame
+            for viewer in list(self.viewers.values()):
+                if not viewer.initialized:
+                    self.send_init(viewer)
+                else:
+                    viewer.enqueue(frame)
+                self.update_interest(viewer)
+
+    def send_init(self, viewer):
+        # Зрителю нужен init с текущим состоянием; декодируем только при подключении
+        state = json.loads(self.latest_frame)['data']
+        message = dict({'type': 'init', 'tank_id': None}, **self.map_info, state=state)
+        viewer.enqueue((json.dumps(message) + '\n').encode('utf-8'))
+        viewer.initialized = True
+
+    def accept_viewer(self):
+        try:
+            conn, addr = self.socket.accept()
+        except BlockingIOError:
+            return
+        configure_socket(conn)
+        conn.setblocking(False)
+        viewer = Viewer(conn, addr)
+        self.viewers[conn.fileno()] = viewer
+        self.selector.register(conn, selectors.EVENT_READ, viewer)
+        if self.latest_frame is not None:
+            self.send_init(viewer)
+            self.update_interest(viewer)
+        print(f"Зритель {addr} подключен, всего: {len(self.viewers)}")
+
+    def drop_viewer(self, viewer):
+        self.viewers.pop(viewer.conn.fileno(), None)
+        self.selector.unregister(viewer.conn)
+        viewer.conn.close()
+        print(f"Зритель {viewer.addr} отключен, всего: {len(self.viewers)}")
+
+    def update_interest(self, viewer):
+        events = selectors.EVENT_READ
+        if viewer.has_data():
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(viewer.conn, events, viewer)
+
+    def handle_viewer(self, viewer, events):
+        try:
+            if events & selectors.EVENT_READ:
+                # Зрители ничего не отправляют; пустое чтение - отключение
+                if not viewer.conn.recv(4096):
+                    self.drop_viewer(viewer)
+                    return
+            if events & selectors.EVENT_WRITE:
+                viewer.flush()
+                self.update_interest(viewer)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop_viewer(viewer)
+
+    def run(self):
+        try:
+            while self.running:
+                now = time.monotonic()
+                if self.upstream is None and now >= self.next_reconnect:
+                    self.connect_upstream()
+
+                self.release_frames(now)
+
+                timeout = 0.05
+                if self.delayed:
+                    timeout = max(0.0, min(timeout, self.delayed[0][0] + self.delay - now))
+                for key, events in self.selector.select(timeout):
+                    if key.data == 'accept':
+                        self.accept_viewer()
+                    elif key.data == 'upstream':
+                        self.read_upstream()
+                    else:
+                        self.handle_viewer(key.data, events)
+        finally:
+            for viewer in list(self.viewers.values()):
+                viewer.conn.close()
+            if self.upstream is not None:
+                self.upstream.close()
+            self.socket.close()
+
+
+if __name__ == '__main__':
+    # python relay.py <адрес сервера> [задержка в секундах]
+    upstream_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    relay = SpectatorRelay(upstream_host, delay=delay)
+    try:
+        relay.run()
+    except KeyboardInterrupt:
+        print("\nОстановка ретранслятора...")
@@ -0,0 +1,86 @@
+import time
+
+TICK_RATE = 30  # Тиков симуляции в секунду
+MAX_SUBSTEPS = 4  # Сколько пропущенных тиков можно догнать за один кадр
+SPIN_MARGIN = 0.001  # Последнюю миллисекунду до дедлайна ждем без сна ОС
+OVERRUN_REPORT_INTERVAL = 5.0
+
+
+class TickScheduler:
+    """Планировщик тиков с фиксированным шагом по монотонным часам.
+
+    Дедлайны считаются от времени старта, а не от конца предыдущего тика,
+    поэтому частота не уплывает из-за времени работы и неточности таймеров ОС.
+    Если кадр опоздал, пропущенные тики догоняются несколькими шагами с тем же
+    dt (не больше max_substeps), остаток времени отбрасывается.
+    """
+
+    def __init__(self, tick_rate=TICK_RATE, max_substeps=MAX_SUBSTEPS, stop_event=None, name="Симуляция"):
+        self.tick_rate = tick_rate
+        self.dt = 1.0 / tick_rate
+        self.max_substeps = max_substeps
+        self.stop_event = stop_event
+        self.name = name
+
+        self.ticks = 0
+        self.overruns = 0  # Кадры, которые не уложились в свой дедлайн
+        self.dropped_ticks = 0  # Тики, отброшенные сверх max_substeps
+        self.last_report_time = 0.0
+        self.reported_overruns = 0
+        self.reported_dropped = 0
+
+    def stopped(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def sleep_until(self, deadline):
+        # perf_counter - монотонные часы с наибольшим доступным разрешением
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or self.stopped():
+                return
+            if remaining > SPIN_MARGIN:
+                if self.stop_event is not None:
+                    self.stop_event.wait(remaining - SPIN_MARGIN)
+                else:
+                    time.sleep(remaining - SPIN_MARGIN)
+            else:
+                time.sleep(0)
+
+    def run(self, step, after_frame=None):
+        """Вызывает step(dt) с фиксированным dt и after_frame() после каждого кадра"""
+        next_tick = time.perf_counter()
+        while not self.stopped():
+            self.sleep_until(next_tick)
+            if self.stopped():
+                break
+
+            now = time.perf_counter()
+            due = int((now - next_tick) / self.dt) + 1
+            if due > 1:
+                self.overruns += 1
+            if due > self.max_substeps:
+                # Догнать все не успеем - отбрасываем лишнее время, а не ускоряем игру
+                skipped = due - self.max_substeps
+                self.dropped_ticks += skipped
+                next_tick += skipped * self.dt
+                due = self.max_substeps
+
+            for _ in range(due):
+                step(self.dt)
+                self.ticks += 1
+                next_tick += self.dt
+
+            if after_frame is not None:
+                after_frame()
+
+            self.report(now)
+
+    def report(self, now):
+        if self.overruns == self.reported_overruns or now - self.last_report_time < OVERRUN_REPORT_INTERVAL:
+            return
+        print(f"{self.name}: {self.overruns - self.reported_overruns} кадров опоздали, "
+              f"отброшено тиков: {self.dropped_ticks - self.reported_dropped} "
+              f"(частота {self.tick_rate} Гц, до {self.max_substeps} шагов за кадр)")
+        self.last_report_time = now
+        self.reported_overruns = self.overruns
+        self.reported_dropped = self.dropped_ticks
@@ -3,25 +3,77 @@ import threading
 import json
 import time
 import signal
+import select
+from collections import deque
 import sys
 from game import Game
+from maps import load_map, DEFAULT_MAP
+from bandwidth import ClientLink, reduce_detail
+from bots import BotManager
+from scheduler import TickScheduler, TICK_RATE
+from simprocess import ProcessSimulation
+from stats import StatsRecorder, DEFAULT_DB
+from transport import configure_socket, parse_buffer_args, Outbox
+from lobby import Lobby, MATCH_SEATS
 
 HOST = '0.0.0.0'
 PORT = 5555
+SPECTATOR_PORT = 5556
+# Напрямую к серверу подключается лишь несколько зрителей (обычно ретрансляторы),
+# чтобы нагрузка на сервер не росла вместе с аудиторией
+MAX_DIRECT_SPECTATORS = 8
+SPECTATOR_INIT_TIMEOUT = 2.0
 
 class GameServer:
-    def __init__(self):
-        # Создаем игру без окна (headless режим)
-        self.game = Game(create_screen=False)
+    def __init__(self, multiprocess=False, tick_rate=TICK_RATE, bot_seats=0, map_id=DEFAULT_MAP, stats_path=DEFAULT_DB,
+                 send_buffer=None, recv_buffer=None, seats=MATCH_SEATS):
+        self.tick_rate = tick_rate
+        self.bots = None
+        self.recorder = None
+        # Клиенты загружают карту у себя по id; хеш позволяет заметить разные версии файла
+        self.map_id = map_id
+        game_map = load_map(map_id)
+        self.map_info = b'"map_id": %s, "map_hash": "%s"' % (json.dumps(map_id).encode('utf-8'), game_map.digest.encode('ascii'))
+        if multiprocess:
+            # Симуляция в отдельном процессе, здесь остается только сетевой ввод-вывод
+            self.game = None
+            self.simulation = ProcessSimulation(tick_rate, bot_seats, map_id, stats_path)
+        else:
+            # Создаем игру без окна (headless режим)
+            self.game = Game(create_screen=False, game_map=game_map)
+            self.simulation = None
+            if stats_path:
+                # Итоги матчей пишутся в SQLite фоновым потоком, тики диска не ждут
+                self.recorder = StatsRecorder(stats_path)
+                self.game.on_match_end = self.recorder.record_match
+            if bot_seats:
+                # Боты занимают свободные места, пока не подключатся игроки
+                self.bots = BotManager(self.game, bot_seats)
+        self.tick = 0  # Номер последнего тика симуляции в этом процессе
+        # Команды игроков применяются в потоке тиков, как и в режиме отдельного процесса:
+        # состояние игры меняет и читает только он (deque безопасен для append/popleft)
+        self.commands = deque()
+        self.snapshot = (0, None)  # Номер тика и снимок, закодированный потоком тиков
+        self.tick_condition = threading.Condition()  # Будит рассылку после каждого кадра
         self.clients = {}
+        self.links = {}  # Оценка канала каждого клиента для адаптивной рассылки
+        self.spectators = {}  # Зрители без танка: адрес -> очередь отправки
         self.next_tank_id = 0
         self.running = True
         self.shutdown_event = threading.Event()
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.bind((HOST, PORT))
-        self.socket.listen(2)
-        print(f"Сервер запущен на {HOST}:{PORT}")
+        self.send_buffer_size = send_buffer
+        self.recv_buffer_size = recv_buffer
+        # Игроки попадают в матч через лобби: оно держит ожидающих, пока нет мест,
+        # матч начинает пара (один игрок, если соперниками будут боты), дальше входят по одному
+        self.lobby = Lobby(HOST, PORT, self.admit, seats, 1 if bot_seats else 2, send_buffer, recv_buffer)
+        
+        self.spectator_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.spectator_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        configure_socket(self.spectator_socket, send_buffer, recv_buffer)
+        self.spectator_socket.bind((HOST, SPECTATOR_PORT))
+        self.spectator_socket.listen(MAX_DIRECT_SPECTATORS)
+        self.spectator_socket.settimeout(1.0)
+        print(f"Сервер запущен на {HOST}:{PORT}, зрители: {SPECTATOR_PORT}")
         print("Сервер работает в фоновом режиме (без окна)")
         print("Нажмите Ctrl+C для остановки сервера")
 
@@ -35,14 +87,51 @@ class GameServer:
         self.running = False
         self.shutdown_event.set()
     
-    def handle_client(self, conn, addr, tank_id):
-        print(f"Клиент {addr} подключен как танк {tank_id}")
-        self.clients[tank_id] = conn
+    def admit(self, conn, addr, profile):
+        """Вход игрока из лобби; подключение и init выполняются в потоке клиента"""
+        tank_id = self.next_tank_id
+        self.next_tank_id += 1
+        client_thread = threading.Thread(
+            target=self.handle_client,
+            args=(conn, addr, tank_id, profile),
+            daemon=True
+        )
+        client_thread.start()
+    
+    def handle_client(self, conn, addr, tank_id, profile):
         buffer = ''
         
         try:
+            # Добавление танка
+            # В статистике игрок учитывается под своим именем; безымянные игроки
+            # (и игроки за одним NAT) не сливаются в одного и в таблицу лидеров не попадают
+            if not self.submit(tank_id, {'type': 'join', 'player': profile['name']}):
+                # Без танка игроку нечего делать в матче - освобождаем место
+                print(f"Клиент {addr} не принят: симуляция не получила join")
+                return
+            
+            # Отправка начального состояния. Снимок текущего тика мог быть
+            # закодирован до подключения - тогда танк появится в следующем
+            _, raw = self.latest_snapshot()
+            initial_message = b'{"type": "init", "tank_id": %d, %s, "state": %s}\n' % (tank_id, self.map_info, raw or b'{}')
+            conn.sendall(initial_message)
+            
+            print(f"Клиент {addr} подключен как танк {tank_id} (регион {profile['region']}, рейтинг {profile['rating']})")
+            # Рассылка пишет в сокет без блокировки, поэтому клиент, который
+            # не читает, задерживает только собственные снимки
+            conn.setblocking(False)
+            link = ClientLink()
+            if raw:
+                # Сущности из init уже есть у клиента - их удаления тоже нужно передать
+                link.packer.mark_all_sent(json.loads(raw), time.monotonic())
+            self.links[tank_id] = link
+            self.clients[tank_id] = Outbox(conn)
+            
             while self.running:
                 try:
+                    readable, _, _ = select.select([conn], [], [], 1.0)
+                    if not readable:
+                        continue
                     data = conn.recv(1024).decode('utf-8')
                     if not data:
                         break
@@ -55,33 +144,21 @@ class GameServer:
                         
                         message = json.loads(line)
                         
-                        if message['type'] == 'move':
-                            # Обновление позиции танка
-                            if tank_id in self.game.tanks:
-                                tank = self.game.tanks[tank_id]
-                                dx = message.get('dx', 0)
-                                dy = message.get('dy', 0)
-                                angle = message.get('angle', tank.angle)
-                                tank.update(dx, dy, angle, self.game.walls, 0.016)
+                        if message['type'] in ('move', 'shoot'):
+                            self.submit(tank_id, message)
                         
-                        elif message['type'] == 'shoot':
-                            # Выстрел
-                            if tank_id in self.game.tanks:
-                                tank = self.game.tanks[tank_id]
-                                bullet = tank.shoot()
-                                if bullet:
-                                    self.game.bullets.append(bullet)
+                        elif message['type'] == 'pong':
+                            # Ответ на ping - обновляем оценку RTT
+                            link = self.links.get(tank_id)
+                            if link and 't' in message:
+                                link.on_pong(message['t'], time.monotonic())
                         
                         elif message['type'] == 'restart':
                             # Перезапуск игры
                             print(f"Игрок {tank_id} запросил перезапуск игры")
-                            self.game.reset_game()
-                            # Запускаем игру снова, если есть минимум 2 игрока
-                            if len(self.game.tanks) >= 2:
-                                self.game.start_game()
-                                print("Игра перезапущена!")
+                            self.submit(tank_id, message)
                 
-                except json.JSONDecodeError:
+                except (json.JSONDecodeError, BlockingIOError, InterruptedError):
                     continue
                 except Exception as e:
                     print(f"Ошибка обработки сообщения от {addr}: {e}")
@@ -92,91 +169,220 @@ class GameServer:
         finally:
             if tank_id in self.clients:
                 del self.clients[tank_id]
-            if tank_id in self.game.tanks:
-                del self.game.tanks[tank_id]
+            self.links.pop(tank_id, None)
+            self.submit(tank_id, {'type': 'leave'})
             conn.close()
+            self.lobby.release()
             print(f"Клиент {addr} отключен")
     
+    def submit(self, tank_id, message):
+        """Передача команды игрока в симуляцию; False - команда отброшена"""
+        if self.simulation is not None:
+            return self.simulation.submit(tank_id, message)
+        self.commands.append((tank_id, message))
+        return True
+    
+    def latest_snapshot(self):
+        """Номер тика и закодированное в JSON состояние мира"""
+        if self.simulation is not None:
+            return self.simulation.latest()
+        # Рассылка и init всех подключившихся за тик используют одну кодировку
+        return self.snapshot
+    
     def game_loop(self):
-        last_time = time.time()
-        while not self.shutdown_event.is_set():
-            current_time = time.time()
-            dt = current_time - last_time
-            last_time = current_time
-
+        def step(dt):
+            while self.commands:
+                tank_id, message = self.commands.popleft()
+                self.game.apply_command(tank_id, message)
+            if self.bots is not None:
+                self.bots.update(dt)
             self.game.update(dt)
-            # Используем wait вместо sleep для быстрого реагирования на сигнал завершения
-            self.shutdown_event.wait(0.033)  # ~30 FPS, синхронизировано с broadcast_loop
+        
+        scheduler = TickScheduler(self.tick_rate, stop_event=self.shutdown_event)
+        scheduler.run(step, self.notify_tick)
+    
+    def notify_tick(self):
+        # Снимок кодируется здесь же, пока поток тиков не меняет состояние
+        raw = json.dumps(self.game.get_state()).encode('utf-8')
+        with self.tick_condition:
+            self.tick += 1
+            self.snapshot = (self.tick, raw)
+            self.tick_condition.notify_all()
+    
+    def wait_for_tick(self, last_seq):
+        """Ожидание следующего кадра симуляции, чтобы рассылка шла в фазе с ней"""
+        if self.simulation is not None:
+            # Другой процесс не может разбудить поток напрямую - следим за счетчиком
+            while self.simulation.latest_seq() == last_seq and not self.shutdown_event.is_set():
+                self.shutdown_event.wait(0.001)
+            return
+        with self.tick_condition:
+            self.tick_condition.wait_for(
+                lambda: self.tick != last_seq or self.shutdown_event.is_set(),
+                timeout=0.1
+            )
     
     def broadcast_loop(self):
+        last_seq = None
         while not self.shutdown_event.is_set():
-            state = self.game.get_state()
-            message = json.dumps({'type': 'state', 'data': state})
+            self.wait_for_tick(last_seq)
+            seq, raw = self.latest_snapshot()
+            if raw is None or seq == last_seq:
+                continue
+            last_seq = seq
+            now = time.monotonic()
+            
+            # Полный снимок не перекодируется: симуляция уже выдала JSON.
+            # Для остальных уровней детализации снимок кодируется один раз за тик
+            encoded = {0: b'{"type": "state", "data": ' + raw + b'}\n'}
+            reduced = {}
+
+            def reduced_state(detail):
+                if detail not in reduced:
+                    if 0 not in reduced:
+                        reduced[0] = json.loads(raw)
+                    reduced[detail] = reduce_detail(reduced[0], detail)
+                return reduced[detail]
 
             disconnected = []
-            for tank_id, conn in self.clients.items():
+            for tank_id, outbox in list(self.clients.items()):
+                link = self.links.get(tank_id)
+                if link is None:
+                    continue
                 try:
-                    conn.sendall((message + '\n').encode('utf-8'))
-                except:
+                    if link.is_due(now):
+                        self.queue_snapshot(tank_id, link, outbox, raw, encoded, reduced_state, now)
+                    # Отправляем, сколько примет сокет; остаток уйдет на следующих тиках
+                    link.on_flush(outbox.flush(), outbox.backlog, now)
+                except OSError:
                     disconnected.append(tank_id)
 
+            # Зрители получают полный снимок каждого тика без адаптации. Как и игрокам,
+            # без блокировки: зритель, который не читает, только пропускает снимки
+            for addr, outbox in list(self.spectators.items()):
+                try:
+                    outbox.enqueue([encoded[0]])
+                    outbox.flush()
+                except OSError:
+                    self.spectators.pop(addr, None)
+                    outbox.conn.close()
+                    print(f"Зритель {addr} отключен")
+
             for tank_id in disconnected:
                 if tank_id in self.clients:
                     del self.clients[tank_id]
-                if tank_id in self.game.tanks:
-                    del self.game.tanks[tank_id]
-
-            # Используем wait вместо sleep для быстрого реагирования на сигнал завершения
-            self.shutdown_event.wait(0.033)  # ~30 обновлений в секунду для снижения сетевой задержки
+                self.links.pop(tank_id, None)
+                self.submit(tank_id, {'type': 'leave'})
+    
+    def queue_snapshot(self, tank_id, link, outbox, raw, encoded, reduced_state, now):
+        """Постановка снимка клиента в очередь отправки"""
+        if link.detail not in encoded:
+            message = json.dumps({'type': 'state', 'data': reduced_state(link.detail)})
+            encoded[link.detail] = (message + '\n').encode('utf-8')
+        data = encoded[link.detail]
+        
+        budget = link.byte_budget()
+        if len(data) > budget:
+            # Снимок не помещается в бюджет клиента - собираем ему свой
+            # из самых важных для него сущностей
+            frame_overhead = len(encoded[0]) - len(raw) + len(' "partial": true,')
+            packed = link.packer.pack(reduced_state(link.detail), tank_id, budget - frame_overhead, now)
+            data = (json.dumps({'type': 'state', 'partial': True, 'data': packed}) + '\n').encode('utf-8')
+        else:
+            link.packer.mark_all_sent(reduced_state(0), now)
+        # Все кадры клиента за тик уходят одним системным вызовом
+        frames = [data]
+        if link.should_ping(now):
+            frames.insert(0, (json.dumps({'type': 'ping', 't': now}) + '\n').encode('utf-8'))
+        # Неотправленный снимок заменяется новым; сущности и удаления
+        # вытесненного снимка возвращаются в очередь упаковщика
+        for dropped in outbox.enqueue(frames, link.packer.last_packed):
+            link.packer.restore(dropped)
+        link.on_queued(sum(len(frame) for frame in frames), now)
+    
+    def spectator_accept_loop(self):
+        while self.running:
+            try:
+                conn, addr = self.spectator_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if self.running:
+                    print(f"Ошибка принятия зрителя: {e}")
+                continue
+            
+            configure_socket(conn, self.send_buffer_size, self.recv_buffer_size)
+            if len(self.spectators) >= MAX_DIRECT_SPECTATORS:
+                print(f"Зритель {addr} отклонен: достигнут лимит, используйте relay.py")
+                conn.close()
+                continue
+            
+            try:
+                # init нельзя вытеснить снимком, поэтому он отправляется здесь,
+                # с ограничением по времени, чтобы не подвесить прием зрителей
+                _, raw = self.latest_snapshot()
+                conn.settimeout(SPECTATOR_INIT_TIMEOUT)
+                conn.sendall(b'{"type": "init", "tank_id": null, %s, "state": %s}\n' % (self.map_info, raw or b'{}'))
+                conn.setblocking(False)
+            except OSError:
+                conn.close()
+                continue
+            self.spectators[addr] = Outbox(conn)
+            print(f"Зритель {addr} подключен")
     
     def run(self):
         # Запуск игрового цикла
-        game_thread = threading.Thread(target=self.game_loop, daemon=True)
-        game_thread.start()
+        if self.simulation is not None:
+            self.simulation.start()
+            print("Симуляция запущена в отдельном процессе")
+        else:
+            game_thread = threading.Thread(target=self.game_loop, daemon=True)
+            game_thread.start()
         
         # Запуск цикла рассылки
         broadcast_thread = threading.Thread(target=self.broadcast_loop, daemon=True)
         broadcast_thread.start()
         
-        # Принятие подключений
-        while self.running:
-            try:
-                conn, addr = self.socket.accept()
-                tank_id = self.next_tank_id
-                self.next_tank_id += 1
-                
-                # Добавление танка
-                self.game.add_tank(tank_id)
-                
-                # Запускаем игру, если подключился второй игрок
-                if len(self.game.tanks) == 2 and not self.game.game_started:
-                    self.game.start_game()
-                    print("Игра началась! Таймер: 60 секунд")
-                
-                # Отправка начального состояния
-                initial_message = json.dumps({
-                    'type': 'init',
-                    'tank_id': tank_id,
-                    'state': self.game.get_state()
-                })
-                conn.sendall((initial_message + '\n').encode('utf-8'))
-                
-                # Запуск обработки клиента
-                client_thread = threading.Thread(
-                    target=self.handle_client,
-                    args=(conn, addr, tank_id),
-                    daemon=True
-                )
-                client_thread.start()
-            
-            except Exception as e:
-                if self.running:
-                    print(f"Ошибка принятия подключения: {e}")
+        # Прием зрителей
+        spectator_thread = threading.Thread(target=self.spectator_accept_loop, daemon=True)
+        spectator_thread.start()
+        
+        # Лобби принимает игроков в основном потоке до остановки сервера
+        self.lobby.run(self.shutdown_event)
         
-        self.socket.close()
+        self.spectator_socket.close()
+        if self.simulation is not None:
+            self.simulation.stop()
+        if self.recorder is not None:
+            self.recorder.close()
 
 if __name__ == '__main__':
-    server = GameServer()
+    # --multiprocess: симуляция в отдельном процессе, сокеты в основном
+    # --tick-rate N: частота тиков симуляции
+    # --bots N: число мест в матче, которые занимают боты, пока нет игроков
+    tick_rate = TICK_RATE
+    if '--tick-rate' in sys.argv:
+        tick_rate = int(sys.argv[sys.argv.index('--tick-rate') + 1])
+    bot_seats = 0
+    if '--bots' in sys.argv:
+        bot_seats = int(sys.argv[sys.argv.index('--bots') + 1])
+    # --map ID: карта из maps/<ID>.json
+    map_id = DEFAULT_MAP
+    if '--map' in sys.argv:
+        map_id = sys.argv[sys.argv.index('--map') + 1]
+    # --stats PATH: файл базы статистики матчей (по умолчанию stats.db)
+    stats_path = DEFAULT_DB
+    if '--stats' in sys.argv:
+        stats_path = sys.argv[sys.argv.index('--stats') + 1]
+    # --sndbuf N, --rcvbuf N: размеры буферов сокетов в байтах
+    send_buffer, recv_buffer = parse_buffer_args(sys.argv)
+    # --seats N: сколько игроков вмещает матч; остальные ждут в лобби
+    seats = MATCH_SEATS
+    if '--seats' in sys.argv:
+        seats = int(sys.argv[sys.argv.index('--seats') + 1])
+    server = GameServer(multiprocess='--multiprocess' in sys.argv, tick_rate=tick_rate,
+                        bot_seats=bot_seats, map_id=map_id, stats_path=stats_path,
+                        send_buffer=send_buffer, recv_buffer=recv_buffer, seats=seats)
     try:
         server.run()
     except KeyboardInterrupt:
@@ -185,7 +391,9 @@ if __name__ == '__main__':
         # Гарантируем корректное завершение
         server.running = False
         server.shutdown_event.set()
-        if hasattr(server, 'socket'):
-            server.socket.close()
+        if hasattr(server, 'lobby'):
+            server.lobby.close()
+        if server.simulation is not None and server.simulation.process.is_alive():
+            server.simulation.stop()
         print("Сервер остановлен.")
 
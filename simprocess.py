@@ -0,0 +1,227 @@
+import json
+import multiprocessing
+import signal
+import struct
+import threading
+from multiprocessing import shared_memory
+
+from maps import load_map, DEFAULT_MAP
+from scheduler import TickScheduler, TICK_RATE
+
+# Кольцевой буфер снимков: заголовок [seq] и слоты [stamp, length, data]
+SNAPSHOT_SLOTS = 8
+SNAPSHOT_SLOT_SIZE = 256 * 1024
+# Очередь ввода: заголовок [head, tail] и слоты [length, data]
+INPUT_SLOTS = 4096
+INPUT_SLOT_SIZE = 256
+
+_U64 = struct.Struct('<Q')
+_U32 = struct.Struct('<I')
+_HEADER_SIZE = 64  # Счетчики в отдельной кэш-линии
+
+
+class SnapshotRing:
+    """Кольцо закодированных снимков мира с номером последнего опубликованного тика.
+
+    Писатель один (процесс симуляции). Каждый слот защищен seqlock-меткой:
+    читатель копирует данные и проверяет, что метка не изменилась, поэтому
+    ни писатель, ни читатели никогда не ждут друг друга.
+    """
+
+    def __init__(self, name=None, slots=SNAPSHOT_SLOTS, slot_size=SNAPSHOT_SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = 16 + slot_size
+        size = _HEADER_SIZE + slots * self.stride
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+
+    def publish(self, data):
+        if len(data) > self.slot_size:
+            return False
+        seq = _U64.unpack_from(self.buf, 0)[0] + 1
+        offset = _HEADER_SIZE + (seq % self.slots) * self.stride
+        # Метка 0 - слот в процессе записи
+        _U64.pack_into(self.buf, offset, 0)
+        _U64.pack_into(self.buf, offset + 8, len(data))
+        self.buf[offset + 16:offset + 16 + len(data)] = data
+        _U64.pack_into(self.buf, offset, seq)
+        _U64.pack_into(self.buf, 0, seq)
+        return True
+
+    def latest_seq(self):
+        return _U64.unpack_from(self.buf, 0)[0]
+
+    def read_latest(self):
+        """Возвращает (seq, bytes) последнего целого снимка или (0, None)"""
+        for _ in range(3):
+            seq = _U64.unpack_from(self.buf, 0)[0]
+            if seq == 0:
+                return 0, None
+            offset = _HEADER_SIZE + (seq % self.slots) * self.stride
+            if _U64.unpack_from(self.buf, offset)[0] != seq:
+                continue
+            length = _U64.unpack_from(self.buf, offset + 8)[0]
+            data = bytes(self.buf[offset + 16:offset + 16 + length])
+            if _U64.unpack_from(self.buf, offset)[0] == seq:
+                return seq, data
+        return 0, None
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class InputQueue:
+    """Очередь сообщений ввода с одним писателем и одним читателем без блокировок.
+
+    head сдвигает только читатель, tail - только писатель. Если в процессе
+    ввода-вывода пишут несколько потоков, они должны сериализоваться сами.
+    """
+
+    def __init__(self, name=None, slots=INPUT_SLOTS, slot_size=INPUT_SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = 4 + slot_size
+        size = _HEADER_SIZE + slots * self.stride
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+
+    def push(self, data):
+        if len(data) > self.slot_size:
+            return False
+        head = _U64.unpack_from(self.buf, 0)[0]
+        tail = _U64.unpack_from(self.buf, 8)[0]
+        if tail - head >= self.slots:
+            return False  # Очередь заполнена
+        offset = _HEADER_SIZE + (tail % self.slots) * self.stride
+        _U32.pack_into(self.buf, offset, len(data))
+        self.buf[offset + 4:offset + 4 + len(data)] = data
+        # Публикуем слот только после того, как он полностью записан
+        _U64.pack_into(self.buf, 8, tail + 1)
+        return True
+
+    def pop_all(self):
+        head = _U64.unpack_from(self.buf, 0)[0]
+        tail = _U64.unpack_from(self.buf, 8)[0]
+        items = []
+        while head < tail:
+            offset = _HEADER_SIZE + (head % self.slots) * self.stride
+            length = _U32.unpack_from(self.buf, offset)[0]
+            items.append(bytes(self.buf[offset + 4:offset + 4 + length]))
+            head += 1
+        _U64.pack_into(self.buf, 0, head)
+        return items
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def simulation_main(snapshot_name, input_name, stop_event, tick_rate=TICK_RATE, bot_seats=0, map_id=DEFAULT_MAP,
+                    stats_path=None):
+    """Точка входа процесса симуляции"""
+    # Ctrl+C получает вся группа процессов; останавливаемся только по stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from bots import BotManager
+    from game import Game
+    from stats import StatsRecorder
+
+    game = Game(create_screen=False, game_map=load_map(map_id))
+    # Статистика пишется из процесса симуляции, где заканчиваются матчи
+    recorder = StatsRecorder(stats_path) if stats_path else None
+    if recorder is not None:
+        game.on_match_end = recorder.record_match
+    bots = BotManager(game, bot_seats) if bot_seats else None
+    snapshots = SnapshotRing(snapshot_name)
+    inputs = InputQueue(input_name)
+
+    def step(dt):
+        for raw in inputs.pop_all():
+            try:
+                message = json.loads(raw)
+                game.apply_command(message['tank_id'], message)
+            except (json.JSONDecodeError, KeyError):
+                continue
+        if bots is not None:
+            bots.update(dt)
+        game.update(dt)
+
+    def publish():
+        # Снимок публикуется раз в кадр, даже если в нем догонялось несколько тиков
+        data = json.dumps(game.get_state()).encode('utf-8')
+        if not snapshots.publish(data):
+            print(f"Снимок не помещается в слот: {len(data)} байт")
+
+    try:
+        TickScheduler(tick_rate, stop_event=stop_event).run(step, publish)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        snapshots.close()
+        inputs.close()
+
+
+class ProcessSimulation:
+    """Симуляция в отдельном процессе: снимки и ввод передаются через общую память"""
+
+    def __init__(self, tick_rate=TICK_RATE, bot_seats=0, map_id=DEFAULT_MAP, stats_path=None):
+        self.snapshots = SnapshotRing()
+        self.inputs = InputQueue()
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        self.process = context.Process(
+            target=simulation_main,
+            args=(self.snapshots.name, self.inputs.name, self.stop_event, tick_rate, bot_seats, map_id, stats_path),
+            daemon=True
+        )
+        # Писателей ввода много (потоки клиентов), а очередь рассчитана на одного
+        self.input_lock = threading.Lock()
+
+    def start(self):
+        self.process.start()
+
+    def submit(self, tank_id, message):
+        """Ставит сообщение в очередь ввода; False - сообщение отброшено"""
+        data = json.dumps(dict(message, tank_id=tank_id)).encode('utf-8')
+        if len(data) > self.inputs.slot_size:
+            print(f"Сообщение танка {tank_id} длиннее слота очереди ввода ({len(data)} байт), отброшено")
+            return False
+        with self.input_lock:
+            if not self.inputs.push(data):
+                print(f"Очередь ввода переполнена, сообщение танка {tank_id} отброшено")
+                return False
+        return True
+
+    def latest(self):
+        return self.snapshots.read_latest()
+
+    def latest_seq(self):
+        return self.snapshots.latest_seq()
+
+    def stop(self):
+        self.stop_event.set()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.snapshots.close()
+        self.inputs.close()
@@ -0,0 +1,188 @@
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_DB = 'stats.db'
+BATCH_SIZE = 500  # Сколько матчей максимум пишется одной транзакцией
+BATCH_WINDOW = 0.5  # Сколько секунд копить записи, прежде чем зафиксировать транзакцию
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    map_name TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    completed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matches_ended_at ON matches (ended_at);
+
+CREATE TABLE IF NOT EXISTS match_players (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    player_key TEXT NOT NULL,
+    tank_id INTEGER NOT NULL,
+    is_bot INTEGER NOT NULL,
+    kills INTEGER NOT NULL,
+    deaths INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    PRIMARY KEY (match_id, tank_id)
+) WITHOUT ROWID;
+-- История игрока: поиск по ключу и сортировка по матчу без сканирования таблицы
+CREATE INDEX IF NOT EXISTS match_players_history ON match_players (player_key, match_id DESC);
+
+-- Итоги по игрокам обновляются в той же транзакции, что и матч,
+-- поэтому таблица лидеров не агрегирует миллионы строк при каждом запросе
+CREATE TABLE IF NOT EXISTS player_totals (
+    player_key TEXT PRIMARY KEY,
+    matches INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    kills INTEGER NOT NULL,
+    deaths INTEGER NOT NULL,
+    last_played REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS player_totals_kills ON player_totals (kills DESC);
+CREATE INDEX IF NOT EXISTS player_totals_wins ON player_totals (wins DESC);
+"""
+
+LEADERBOARD_ORDER = {
+    'kills': 'kills DESC',
+    'wins': 'wins DESC',
+}
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class StatsRecorder:
+    """Запись статистики матчей в SQLite из фонового потока.
+
+    record_match только кладет итог в очередь, поэтому поток тиков никогда
+    не ждет диска. Писатель забирает из очереди все, что накопилось за
+    BATCH_WINDOW, и фиксирует одной транзакцией.
+    """
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.thread.start()
+
+    def record_match(self, summary):
+        self.queue.put(summary)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+    def writer_loop(self):
+        conn = connect(self.path)
+        try:
+            while True:
+                summary = self.queue.get()
+                if summary is None:
+                    break
+                batch = [summary]
+                deadline = time.monotonic() + BATCH_WINDOW
+                stop = False
+                while len(batch) < BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        summary = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if summary is None:
+                        stop = True
+                        break
+                    batch.append(summary)
+
+                try:
+                    with conn:
+                        for summary in batch:
+                            self.write_match(conn, summary)
+                except sqlite3.Error as e:
+                    print(f"Ошибка записи статистики ({len(batch)} матчей): {e}")
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    @staticmethod
+    def write_match(conn, summary):
+        cursor = conn.execute(
+            'INSERT INTO matches (map_name, started_at, ended_at, duration, completed) VALUES (?, ?, ?, ?, ?)',
+            (summary['map_name'], summary['started_at'], summary['ended_at'],
+             summary['duration'], int(summary['completed']))
+        )
+        match_id = cursor.lastrowid
+        players = summary['players']
+        conn.executemany(
+            'INSERT INTO match_players (match_id, player_key, tank_id, is_bot, kills, deaths, won) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(match_id, p['player_key'], p['tank_id'], int(p['is_bot']), p['kills'], p['deaths'], int(p['won']))
+             for p in players]
+        )
+        # Несколько мест с одним ключом (переподключение под тем же именем)
+        # засчитываются как один сыгранный матч. Боты и безымянные игроки
+        # остаются только в истории матчей: их ключи не повторяются между
+        # матчами, и каждый занимал бы в таблице лидеров отдельную строку
+        totals = {}
+        for p in players:
+            if p['is_bot'] or p.get('anonymous'):
+                continue
+            won, kills, deaths = totals.get(p['player_key'], (0, 0, 0))
+            totals[p['player_key']] = (max(won, int(p['won'])), kills + p['kills'], deaths + p['deaths'])
+        conn.executemany(
+            'INSERT INTO player_totals (player_key, matches, wins, kills, deaths, last_played) '
+            'VALUES (?, 1, ?, ?, ?, ?) '
+            'ON CONFLICT (player_key) DO UPDATE SET '
+            'matches = matches + 1, wins = wins + excluded.wins, kills = kills + excluded.kills, '
+            'deaths = deaths + excluded.deaths, last_played = excluded.last_played',
+            [(key, won, kills, deaths, summary['ended_at']) for key, (won, kills, deaths) in totals.items()]
+        )
+
+
+def leaderboard(path=DEFAULT_DB, limit=10, order='kills'):
+    conn = connect(path)
+    try:
+        return conn.execute(
+            f'SELECT player_key, matches, wins, kills, deaths FROM player_totals '
+            f'ORDER BY {LEADERBOARD_ORDER[order]} LIMIT ?',
+            (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def player_history(player_key, path=DEFAULT_DB, limit=20):
+    conn = connect(path)
+    try:
+        return conn.execute(
+            'SELECT m.id, m.map_name, m.ended_at, m.duration, m.completed, p.kills, p.deaths, p.won '
+            'FROM match_players p JOIN matches m ON m.id = p.match_id '
+            'WHERE p.player_key = ? ORDER BY p.match_id DESC LIMIT ?',
+            (player_key, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    # python stats.py - таблица лидеров, python stats.py <игрок> - история игрока
+    if len(sys.argv) > 1:
+        for match_id, map_name, ended_at, duration, completed, kills, deaths, won in player_history(sys.argv[1]):
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(ended_at))
+            result = 'победа' if won else ('прерван' if not completed else 'поражение')
+            print(f"#{match_id} {when} {map_name}: {kills} убийств, {deaths} смертей, {result}")
+    else:
+        for rank, (player_key, matches, wins, kills, deaths) in enumerate(leaderboard(), 1):
+            print(f"{rank}. {player_key}: {kills} убийств, {wins} побед, {matches} матчей, {deaths} смертей")
@@ -0,0 +1,133 @@
+import socket
+from collections import deque
+
+# Размеры буферов сокета в байтах; None - оставить значения ОС
+SEND_BUFFER_SIZE = None
+RECV_BUFFER_SIZE = None
+MAX_IOV = 64  # Сколько кадров передается в один sendmsg
+OUTBOX_MAX_PENDING = 1  # Сколько неначатых сообщений ждет отправки; более старые вытесняются
+
+
+def configure_socket(sock, send_buffer=SEND_BUFFER_SIZE, recv_buffer=RECV_BUFFER_SIZE):
+    """Единые настройки игровых сокетов.
+
+    TCP_NODELAY отключает алгоритм Нейгла: маленькие сообщения ввода и
+    снимки уходят сразу, а не ждут подтверждения предыдущих. Буферы
+    нужно задавать до connect (на сервере - на слушающем сокете),
+    чтобы от них зависело окно TCP.
+    """
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if send_buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer)
+    if recv_buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, recv_buffer)
+    return sock
+
+
+def send_frames(sock, frames):
+    """Отправка нескольких кадров одним системным вызовом (writev через sendmsg).
+
+    Кадры не склеиваются в новую строку; если сокет принял не все,
+    остаток досылается. Возвращает число отправленных байт.
+    """
+    if not hasattr(sock, 'sendmsg'):
+        # На Windows sendmsg нет - склеиваем и отправляем одним sendall
+        data = b''.join(frames)
+        sock.sendall(data)
+        return len(data)
+
+    buffers = [memoryview(frame) for frame in frames if frame]
+    total = 0
+    while buffers:
+        sent = sock.sendmsg(buffers[:MAX_IOV])
+        total += sent
+        while sent:
+            if sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            else:
+                buffers[0] = buffers[0][sent:]
+                sent = 0
+    return total
+
+
+class Outbox:
+    """Неблокирующая отправка клиенту с ограниченной очередью сообщений.
+
+    Сообщение - список кадров одного тика. Отправка никогда не ждет сокет:
+    что не принял буфер ядра, остается в очереди до следующего flush. Если
+    клиент не успевает, неначатые сообщения вытесняются новыми, поэтому
+    память и время рассылки не зависят от медленных клиентов.
+    """
+
+    def __init__(self, conn, max_pending=OUTBOX_MAX_PENDING):
+        self.conn = conn
+        self.max_pending = max_pending
+        self.pending = deque()  # (кадры, размер, meta) еще не начатых сообщений
+        self.current = []  # Недоотправленные части начатого сообщения (memoryview)
+        self.backlog = 0  # Байт ждут отправки
+
+    def enqueue(self, frames, meta=None):
+        """Ставит сообщение в очередь; возвращает meta вытесненных сообщений"""
+        dropped = []
+        while self.pending and len(self.pending) >= self.max_pending:
+            _, size, old_meta = self.pending.popleft()
+            self.backlog -= size
+            dropped.append(old_meta)
+        size = sum(len(frame) for frame in frames)
+        self.pending.append((frames, size, meta))
+        self.backlog += size
+        return dropped
+
+    def has_data(self):
+        return self.backlog > 0
+
+    def flush(self):
+        """Отправляет сколько примет сокет; возвращает число отправленных байт.
+
+        OSError, кроме отсутствия места в буфере, означает разрыв соединения.
+        """
+        total = 0
+        while self.backlog:
+            buffers = list(self.current)
+            for frames, _, _ in self.pending:
+                buffers.extend(memoryview(frame) for frame in frames)
+                if len(buffers) >= MAX_IOV:
+                    break
+            try:
+                if hasattr(self.conn, 'sendmsg'):
+                    sent = self.conn.sendmsg(buffers[:MAX_IOV])
+                else:
+                    sent = self.conn.send(b''.join(buffers[:MAX_IOV]))
+            except (BlockingIOError, InterruptedError):
+                break
+            if not sent:
+                break
+            total += sent
+            self.backlog -= sent
+            while sent:
+                if not self.current:
+                    frames, _, _ = self.pending.popleft()
+                    self.current = [memoryview(frame) for frame in frames if frame]
+                part = self.current[0]
+                if sent >= len(part):
+                    sent -= len(part)
+                    self.current.pop(0)
+                else:
+                    self.current[0] = part[sent:]
+                    sent = 0
+        return total
+
+
+def parse_buffer_args(args):
+    """Забирает из списка аргументов --sndbuf N и --rcvbuf N"""
+    sizes = []
+    for flag, default in (('--sndbuf', SEND_BUFFER_SIZE), ('--rcvbuf', RECV_BUFFER_SIZE)):
+        size = default
+        if flag in args:
+            index = args.index(flag)
+            size = int(args[index + 1])
+            del args[index:index + 2]
+        sizes.append(size)
+    return tuple(sizes)